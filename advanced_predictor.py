@@ -3,14 +3,74 @@ import torch.nn as nn
 import cv2
 import numpy as np
 from PIL import Image
+import atexit
 import json
 import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from efficientnet_pytorch import EfficientNet
 
+from metrics import metrics
+
+# Test Time Augmentation (TTA) views scored alongside the original image.
+# Every view keeps the 224x224 shape so they can share one forward pass.
+TTA_MODES = {
+    'none': [],
+    'flips': [
+        lambda x: torch.flip(x, [3]),  # Horizontal flip
+        lambda x: torch.flip(x, [2]),  # Vertical flip
+    ],
+    'full': [
+        lambda x: torch.flip(x, [3]),  # Horizontal flip
+        lambda x: torch.flip(x, [2]),  # Vertical flip
+        lambda x: torch.rot90(x, 1, [2, 3]),  # 90° rotation
+        lambda x: torch.rot90(x, 2, [2, 3]),  # 180° rotation
+        lambda x: torch.rot90(x, 3, [2, 3]),  # 270° rotation
+    ],
+}
+
+# Adaptive TTA scores the original view first and only adds these groups of
+# views, one step at a time, while the prediction is still uncertain. Once
+# every step has run the ensemble is the same as 'full'.
+ADAPTIVE_TTA_STEPS = [TTA_MODES['full'][:2], TTA_MODES['full'][2:]]
+
+# Network input size and ImageNet normalization folded into one multiply-add:
+# (x / 255 - mean) / std == x * scale - shift
+INPUT_SIZE = 224
+IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+IMAGENET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+NORMALIZE_SCALE = (1.0 / (255.0 * IMAGENET_STD)).reshape(1, 3, 1, 1)
+NORMALIZE_SHIFT = (IMAGENET_MEAN / IMAGENET_STD).reshape(1, 3, 1, 1)
+
+# CPU inference backends, chosen once at startup
+INFERENCE_MODES = ('fp32', 'bf16', 'int8', 'channels_last', 'compiled')
+
+# Self-contained export: architecture, weights and class mapping in one file
+BUNDLE_FILENAME = 'model_bundle.pt'
+
+# Checkpoint snapshots taken by this process, removed when it exits
+_snapshots = set()
+_snapshot_pid = os.getpid()
+
+@atexit.register
+def _remove_snapshots():
+    # Forked children inherit the set but must not delete what their parent still uses
+    if os.getpid() == _snapshot_pid:
+        for path in list(_snapshots):
+            shutil.rmtree(path, ignore_errors=True)
+
 class AdvancedFruitDiseaseModel(nn.Module):
-    def __init__(self, num_classes, model_name='efficientnet-b2'):
+    def __init__(self, num_classes, model_name='efficientnet-b2', pretrained=True):
         super().__init__()
-        self.backbone = EfficientNet.from_pretrained(model_name)
+        # ImageNet weights only matter for training; inference loads its own checkpoint
+        if pretrained:
+            self.backbone = EfficientNet.from_pretrained(model_name)
+        else:
+            self.backbone = EfficientNet.from_name(model_name)
         in_features = self.backbone._fc.in_features
         self.classifier = nn.Sequential(
             nn.Dropout(0.3),
@@ -26,51 +86,100 @@ class AdvancedFruitDiseaseModel(nn.Module):
         return self.classifier(x)
 
 class AdvancedPredictor:
-    def __init__(self, model_path='models/', confidence_threshold=0.95):
+    def __init__(self, model_path='models/', confidence_threshold=0.95, tta_mode='full',
+                 early_exit_confidence=0.9, early_exit_margin=0.5, inference_mode='fp32',
+                 model_name=None, class_mapping_file=None, snapshot_dir=None):
+        if inference_mode not in INFERENCE_MODES:
+            raise ValueError(f"Unknown inference mode '{inference_mode}', expected one of {list(INFERENCE_MODES)}")
+        
         self.model_path = model_path
+        # Overrides for checkpoints that do not carry their own architecture or class mapping
+        self.model_name_override = model_name
+        self.class_mapping_file = class_mapping_file
+        # With snapshot_dir the checkpoint is copied there and loaded from the copy (see take_snapshot)
+        self.snapshot_dir = snapshot_dir
+        self.snapshot_path = None
+        self.inference_mode = inference_mode
         self.confidence_threshold = confidence_threshold
+        self.tta_mode = tta_mode
+        
+        # Adaptive TTA stops adding views once both bounds are met
+        self.early_exit_confidence = early_exit_confidence
+        self.early_exit_margin = early_exit_margin
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
         
         self.model = None
+        self.model_name = 'efficientnet-b2'
+        self.model_version = 'untrained'
+        self.compiled_backend = None  # what 'compiled' mode ended up running on
+        self.startup_timings = {}
         self.classes = []
         self.class_to_idx = {}
         
+        # Preallocated input buffers reused by each inference thread
+        self._buffers = threading.local()
+        
         self.load_model()
-        self.setup_transforms()
     
     def load_model(self):
         """Load trained model and class mappings"""
         try:
-            # Check if model files exist
-            model_file = os.path.join(self.model_path, 'best_model.pth')
-            class_file = os.path.join(self.model_path, 'class_mapping.json')
+            # Prefer the single-file bundle, fall back to checkpoint + class mapping,
+            # unless the checkpoint is the newer of the two
+            model_path = self.model_path
+            class_file = self.class_mapping_file or os.path.join(model_path, 'class_mapping.json')
+            if self.snapshot_dir:
+                model_path = self.take_snapshot(class_file)
+                class_file = os.path.join(model_path, 'class_mapping.json')
+            bundle_file = os.path.join(model_path, BUNDLE_FILENAME)
+            model_file = os.path.join(model_path, 'best_model.pth')
+            
+            use_bundle = os.path.exists(bundle_file)
+            has_checkpoint = os.path.exists(model_file) and os.path.exists(class_file)
+            # A checkpoint deployed after the last export must not be shadowed by the stale bundle
+            if use_bundle and has_checkpoint and os.path.getmtime(model_file) > os.path.getmtime(bundle_file):
+                print(f"WARNING: {bundle_file} is older than {model_file}, loading the checkpoint")
+                print("Run: python export_model.py to refresh the bundle")
+                use_bundle = False
             
-            if not os.path.exists(model_file) or not os.path.exists(class_file):
+            start = time.perf_counter()
+            if use_bundle:
+                source_file = bundle_file
+                checkpoint = torch.load(bundle_file, map_location=self.device)
+                class_data = checkpoint
+            elif has_checkpoint:
+                source_file = model_file
+                # Load class mapping
+                with open(class_file, 'r') as f:
+                    class_data = json.load(f)
+                checkpoint = torch.load(model_file, map_location=self.device)
+            else:
                 print("WARNING: No trained model found. Please train model first.")
                 print("Run: python train_model.py")
                 self.classes = ['apple_healthy', 'tomato_healthy']
                 self.class_to_idx = {cls: idx for idx, cls in enumerate(self.classes)}
                 self.model = None
                 return
-            
-            # Load class mapping
-            with open(class_file, 'r') as f:
-                class_data = json.load(f)
+            self.startup_timings['read_ms'] = (time.perf_counter() - start) * 1000
             
             self.classes = class_data['classes']
             self.class_to_idx = class_data['class_to_idx']
             num_classes = class_data['num_classes']
-            
-            # Load model with error handling
-            checkpoint = torch.load(model_file, map_location=self.device)
+            self.model_name = self.model_name_override or class_data.get('model_name', 'efficientnet-b2')
             
             # Try to load model
             try:
-                self.model = AdvancedFruitDiseaseModel(num_classes, 'efficientnet-b2')
+                # Built from config alone - no ImageNet download, the checkpoint supplies every weight
+                start = time.perf_counter()
+                self.model = AdvancedFruitDiseaseModel(num_classes, self.model_name, pretrained=False)
+                self.startup_timings['construct_ms'] = (time.perf_counter() - start) * 1000
+                
+                start = time.perf_counter()
                 if 'model_state_dict' in checkpoint:
                     self.model.load_state_dict(checkpoint['model_state_dict'])
                 else:
                     self.model.load_state_dict(checkpoint)
+                self.startup_timings['load_weights_ms'] = (time.perf_counter() - start) * 1000
             except Exception as e:
                 print(f"Warning: Could not load model: {e}")
                 self.model = None
@@ -78,9 +187,21 @@ class AdvancedPredictor:
             
             self.model.to(self.device)
             self.model.eval()
+            start = time.perf_counter()
+            self.apply_inference_mode()
+            self.startup_timings['inference_mode_ms'] = (time.perf_counter() - start) * 1000
+            
+            # Identifies these weights in cache keys
+            model_stat = os.stat(source_file)
+            self.model_version = f"{model_stat.st_size:x}-{int(model_stat.st_mtime):x}"
             
             print(f"Model loaded successfully!")
+            print(f"   Source: {source_file}")
             print(f"   Classes: {len(self.classes)}")
+            if self.compiled_backend:
+                print(f"   Inference mode: {self.inference_mode} ({self.compiled_backend})")
+            else:
+                print(f"   Inference mode: {self.inference_mode}")
             if isinstance(checkpoint, dict) and 'accuracy' in checkpoint:
                 print(f"   Accuracy: {checkpoint['accuracy']:.2f}%")
             
@@ -91,99 +212,276 @@ class AdvancedPredictor:
             self.class_to_idx = {cls: idx for idx, cls in enumerate(self.classes)}
             self.model = None
     
-    def setup_transforms(self):
-        """Setup image preprocessing transforms"""
-        import torchvision.transforms as transforms
-        self.transform = transforms.Compose([
-            transforms.ToPILImage(),
-            transforms.Resize((224, 224)),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-        ])
+    def init_kwargs(self):
+        """Constructor arguments that rebuild this predictor, e.g. in another process"""
+        return {
+            'model_path': self.model_path,
+            'confidence_threshold': self.confidence_threshold,
+            'tta_mode': self.tta_mode,
+            'early_exit_confidence': self.early_exit_confidence,
+            'early_exit_margin': self.early_exit_margin,
+            'inference_mode': self.inference_mode,
+            'model_name': self.model_name_override,
+            'class_mapping_file': self.class_mapping_file,
+            'snapshot_dir': self.snapshot_dir
+        }
     
-    def preprocess_image(self, image):
-        """Preprocess image for prediction"""
+    def result_settings(self):
+        """Settings besides the weights that change a result, for cache keys"""
+        return f"exit={self.early_exit_confidence:g}/{self.early_exit_margin:g}"
+    
+    def pinned_init_kwargs(self):
+        """Like init_kwargs, but rebuilding exactly the weights loaded here.
+        
+        With a snapshot that is the copy taken at load time, however the
+        files in model_path have changed since; without one, model_path as is.
+        """
+        if self.snapshot_path is None:
+            return self.init_kwargs()
+        return dict(self.init_kwargs(), model_path=self.snapshot_path, class_mapping_file=None, snapshot_dir=None)
+    
+    def take_snapshot(self, class_file):
+        """Copy the checkpoint files into a new directory under snapshot_dir and return it.
+        
+        Inference pool workers load this copy, so they run the same weights
+        as this predictor even after the checkpoint in model_path has been
+        replaced, e.g. when rolling back to it. copy2 keeps the modification
+        time, so model_version is the same as for the original.
+        """
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        snapshot = tempfile.mkdtemp(prefix='model-', dir=self.snapshot_dir)
+        _snapshots.add(snapshot)
+        self.snapshot_path = snapshot
+        
+        for name in (BUNDLE_FILENAME, 'best_model.pth'):
+            source = os.path.join(self.model_path, name)
+            if os.path.exists(source):
+                shutil.copy2(source, os.path.join(snapshot, name))
+        if os.path.exists(class_file):
+            shutil.copy2(class_file, os.path.join(snapshot, 'class_mapping.json'))
+        return snapshot
+    
+    def release_snapshot(self):
+        """Delete the checkpoint copy once nothing will rebuild this predictor any more"""
+        if self.snapshot_path is not None:
+            shutil.rmtree(self.snapshot_path, ignore_errors=True)
+            _snapshots.discard(self.snapshot_path)
+            self.snapshot_path = None
+    
+    def apply_inference_mode(self):
+        """Convert the loaded fp32 model for the configured inference backend"""
+        if self.inference_mode == 'int8':
+            # Dynamic quantization only covers Linear layers (the classifier head)
+            self.model = torch.quantization.quantize_dynamic(self.model, {nn.Linear}, dtype=torch.qint8)
+        elif self.inference_mode == 'channels_last':
+            self.model = self.model.to(memory_format=torch.channels_last)
+        elif self.inference_mode == 'compiled':
+            self.compile_model()
+    
+    def compile_model(self):
+        """Graph-compile the model, falling back to a TorchScript trace and then to eager fp32.
+        
+        Compilation is only a speed-up: a missing compiler or a failed
+        warm-up must not leave the service without a model.
+        """
+        # The memory-efficient swish is a custom autograd function that graphs cannot capture
+        self.model.backbone.set_swish(memory_efficient=False)
+        eager = self.model
+        example = torch.randn(1, 3, 224, 224, device=self.device)
+        
+        def traced():
+            with torch.no_grad():
+                return torch.jit.freeze(torch.jit.trace(eager, example))
+        
+        backends = [('torch.compile', lambda: torch.compile(eager, dynamic=True))] if hasattr(torch, 'compile') else []
+        for backend, build in backends + [('torchscript', traced)]:
+            try:
+                self.model = build()
+                # Pay the compilation cost at startup rather than on the first request;
+                # compile errors also surface only here
+                self.forward(example)
+                self.compiled_backend = backend
+                return
+            except Exception as e:
+                print(f"WARNING: {backend} failed ({type(e).__name__}: {e}), trying the next backend")
+                self.model = eager
+        
+        self.compiled_backend = 'eager'
+        print("WARNING: Model compilation unavailable, running eager fp32")
+    
+    def forward(self, batch):
+        """Run the model on a batch with the configured inference backend"""
+        if self.inference_mode == 'channels_last':
+            batch = batch.contiguous(memory_format=torch.channels_last)
+        
+        metrics.count('model_passes_total', batch.shape[0])
+        with metrics.stage('forward'), torch.no_grad():
+            if self.inference_mode == 'bf16':
+                with torch.autocast(device_type=self.device.type, dtype=torch.bfloat16):
+                    return self.model(batch).float()
+            return self.model(batch)
+    
+    def load_image(self, image):
+        """Decode if needed and resize to the network input size as uint8 HWC.
+        
+        Channels keep the order they arrived in (BGR from cv2.imread); the
+        swap to RGB is folded into normalize_stack.
+        """
         if isinstance(image, str):
             # Load from file path
-            image = cv2.imread(image)
-            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        elif isinstance(image, np.ndarray):
-            # Already numpy array
-            if len(image.shape) == 3 and image.shape[2] == 3:
-                # Assume BGR, convert to RGB
-                image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+            path = image
+            image = cv2.imread(path)
+            if image is None:
+                raise ValueError(f"Could not read image: {path}")
+        
+        image = np.asarray(image)
+        if image.ndim == 2:
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        elif image.shape[2] == 4:
+            image = image[:, :, :3]
+        
+        # INTER_AREA when shrinking stays close to PIL's antialiased resize
+        height, width = image.shape[:2]
+        interpolation = cv2.INTER_AREA if height > INPUT_SIZE or width > INPUT_SIZE else cv2.INTER_LINEAR
+        return cv2.resize(image, (INPUT_SIZE, INPUT_SIZE), interpolation=interpolation)
+    
+    def normalize_stack(self, images, out=None):
+        """Channel swap, scale, normalize and CHW layout for resized images in one vectorized pass.
+        
+        images is a list of uint8 HWC arrays or a uint8 NHWC stack. Results
+        are written into out (a float32 NCHW array) when given, and the
+        returned tensor shares its memory.
+        """
+        count = len(images)
+        if out is None:
+            out = np.empty((count, 3, INPUT_SIZE, INPUT_SIZE), dtype=np.float32)
+        
+        if isinstance(images, np.ndarray) and images.ndim == 4:
+            np.multiply(images[..., ::-1].transpose(0, 3, 1, 2), NORMALIZE_SCALE, out=out)
+        else:
+            for i, image in enumerate(images):
+                np.multiply(image[..., ::-1].transpose(2, 0, 1), NORMALIZE_SCALE[0], out=out[i])
+        out -= NORMALIZE_SHIFT
+        
+        return torch.from_numpy(out)
+    
+    def input_buffer(self, count):
+        """Reusable per-thread float32 NCHW buffer with room for count images"""
+        buffer = getattr(self._buffers, 'array', None)
+        if buffer is None or buffer.shape[0] < count:
+            buffer = np.empty((count, 3, INPUT_SIZE, INPUT_SIZE), dtype=np.float32)
+            self._buffers.array = buffer
+        return buffer[:count]
+    
+    def preprocess_image(self, image):
+        """Preprocess image for prediction"""
+        return self.normalize_stack([self.load_image(image)])
+    
+    def build_tta_batch(self, tensor_image, tta_mode=None):
+        """Stack the original view and its TTA views into one [N,3,H,W] batch"""
+        tta_mode = tta_mode or self.tta_mode
+        if tta_mode not in TTA_MODES:
+            raise ValueError(f"Unknown TTA mode '{tta_mode}', expected one of {list(TTA_MODES) + ['adaptive']}")
+        
+        views = [tensor_image] + [transform(tensor_image) for transform in TTA_MODES[tta_mode]]
+        return torch.cat(views, dim=0)
+    
+    def predict_tensors(self, batch, tta_mode=None):
+        """Predict a preprocessed [B,3,H,W] batch, all TTA views in one forward"""
+        batch = batch.to(self.device)
+        if (tta_mode or self.tta_mode) == 'adaptive':
+            return self.predict_adaptive(batch)
+        
+        tta_views = self.build_tta_batch(batch, tta_mode)
+        outputs = self.forward(tta_views)
+        
+        # Views are stacked view-major, so [V*B, C] -> [V, B, C] and average over V
+        num_views = tta_views.shape[0] // batch.shape[0]
+        probs = torch.softmax(outputs, dim=1).view(num_views, batch.shape[0], -1)
+        ensemble_pred = probs.mean(dim=0)
+        confidence, predicted_idx = torch.max(ensemble_pred, 1)
+        
+        return [self.format_prediction(idx.item(), conf.item(), num_views)
+                for conf, idx in zip(confidence, predicted_idx)]
+    
+    def predict_adaptive(self, batch):
+        """Early-exit TTA: augmented views only run for images that are still uncertain"""
+        probs_sum = torch.softmax(self.forward(batch), dim=1)
+        passes = torch.ones(batch.shape[0], device=batch.device)
+        
+        for step in ADAPTIVE_TTA_STEPS:
+            uncertain = (~self.is_confident(probs_sum / passes.unsqueeze(1))).nonzero().flatten()
+            if uncertain.numel() == 0:
+                break
+            
+            subset = batch[uncertain]
+            outputs = self.forward(torch.cat([transform(subset) for transform in step], dim=0))
+            probs = torch.softmax(outputs, dim=1).view(len(step), subset.shape[0], -1)
+            probs_sum[uncertain] += probs.sum(dim=0)
+            passes[uncertain] += len(step)
+        
+        confidence, predicted_idx = torch.max(probs_sum / passes.unsqueeze(1), 1)
+        return [self.format_prediction(idx.item(), conf.item(), int(n.item()))
+                for conf, idx, n in zip(confidence, predicted_idx, passes)]
+    
+    def is_confident(self, probs):
+        """Mask of rows whose top-1 probability and top-1/top-2 margin clear the early-exit bounds"""
+        top = probs.topk(min(2, probs.shape[1]), dim=1).values
+        margin = top[:, 0] - top[:, 1] if top.shape[1] > 1 else top[:, 0]
+        return (top[:, 0] >= self.early_exit_confidence) & (margin >= self.early_exit_margin)
+    
+    def format_prediction(self, predicted_idx, confidence, tta_passes):
+        """Build the prediction dict for a class index and its probability"""
+        predicted_class = self.classes[predicted_idx]
+        confidence_score = confidence * 100
         
-        # Apply transforms
-        tensor_image = self.transform(image).unsqueeze(0)
+        # Parse fruit and disease
+        fruit_name, disease_type = self.parse_class_name(predicted_class)
         
-        return tensor_image
+        return {
+            'fruit': fruit_name,
+            'disease': disease_type,
+            'confidence': confidence_score,
+            'is_healthy': disease_type.lower() == 'healthy',
+            'high_confidence': confidence_score >= self.confidence_threshold * 100,
+            'tta_passes': tta_passes
+        }
     
-    def predict_single(self, image):
+    def no_model_result(self):
+        """Result returned when no trained model is loaded"""
+        return {
+            'fruit': 'No_Model',
+            'disease': 'please_train_model_first',
+            'confidence': 0,
+            'is_healthy': False,
+            'high_confidence': False
+        }
+    
+    def error_result(self, error):
+        """Result returned when analysis of an image fails"""
+        return {
+            'fruit': 'Unknown',
+            'disease': 'Analysis Failed',
+            'confidence': 0.0,
+            'is_healthy': False,
+            'high_confidence': False,
+            'error': str(error)
+        }
+    
+    def predict_single(self, image, tta_mode=None):
         """Predict single image with high accuracy"""
         try:
             # Return error if no trained model
             if self.model is None:
-                return {
-                    'fruit': 'No_Model',
-                    'disease': 'please_train_model_first',
-                    'confidence': 0,
-                    'is_healthy': False,
-                    'high_confidence': False
-                }
-            
-            # Preprocess image
-            tensor_image = self.preprocess_image(image)
-            tensor_image = tensor_image.to(self.device)
-            
-            # Predict with multiple crops for better accuracy
-            predictions = []
-            
-            with torch.no_grad():
-                # Original prediction
-                output = self.model(tensor_image)
-                predictions.append(torch.softmax(output, dim=1))
-                
-                # Test Time Augmentation (TTA) for 100% accuracy
-                tta_transforms = [
-                    lambda x: torch.flip(x, [3]),  # Horizontal flip
-                    lambda x: torch.flip(x, [2]),  # Vertical flip
-                    lambda x: torch.rot90(x, 1, [2, 3]),  # 90° rotation
-                    lambda x: torch.rot90(x, 2, [2, 3]),  # 180° rotation
-                    lambda x: torch.rot90(x, 3, [2, 3]),  # 270° rotation
-                ]
-                
-                for tta_transform in tta_transforms:
-                    tta_input = tta_transform(tensor_image)
-                    tta_output = self.model(tta_input)
-                    predictions.append(torch.softmax(tta_output, dim=1))
-            
-            # Ensemble prediction
-            ensemble_pred = torch.mean(torch.stack(predictions), dim=0)
-            confidence, predicted_idx = torch.max(ensemble_pred, 1)
-            
-            predicted_class = self.classes[predicted_idx.item()]
-            confidence_score = confidence.item() * 100
+                return self.no_model_result()
             
-            # Parse fruit and disease
-            fruit_name, disease_type = self.parse_class_name(predicted_class)
-            
-            return {
-                'fruit': fruit_name,
-                'disease': disease_type,
-                'confidence': confidence_score,
-                'is_healthy': disease_type.lower() == 'healthy',
-                'high_confidence': confidence_score >= self.confidence_threshold * 100
-            }
+            # Preprocess into this thread's buffer and score it with its TTA views
+            with metrics.stage('preprocess'):
+                tensor_image = self.normalize_stack([self.load_image(image)], out=self.input_buffer(1))
+            return self.predict_tensors(tensor_image, tta_mode)[0]
             
         except Exception as e:
-            return {
-                'fruit': 'Unknown',
-                'disease': 'Analysis Failed',
-                'confidence': 0.0,
-                'is_healthy': False,
-                'high_confidence': False,
-                'error': str(e)
-            }
+            return self.error_result(e)
     
     def parse_class_name(self, class_name):
         """Parse class name to extract fruit and disease"""
@@ -200,14 +498,61 @@ class AdvancedPredictor:
         
         return fruit, disease
     
-    def predict_batch(self, image_paths):
-        """Predict multiple images"""
-        results = []
+    def predict_batch(self, image_paths, batch_size=16, num_workers=4, tta_mode=None):
+        """Predict multiple images, yielding results in input order.
         
-        for image_path in image_paths:
-            result = self.predict_single(image_path)
-            result['image_path'] = image_path
-            results.append(result)
+        A thread pool decodes and preprocesses upcoming images while the
+        current batch is in the model; at most two batches are in flight,
+        so memory stays bounded however long image_paths is. Items may be
+        file paths or numpy arrays.
+        """
+        with ThreadPoolExecutor(max_workers=num_workers) as pool:
+            items = iter(image_paths)
+            pending = deque()
+            
+            def schedule():
+                while len(pending) < batch_size * 2:
+                    try:
+                        item = next(items)
+                    except StopIteration:
+                        return
+                    pending.append((item, pool.submit(self.load_image, item)))
+            
+            schedule()
+            while pending:
+                batch = [pending.popleft() for _ in range(min(batch_size, len(pending)))]
+                # Queue the next decodes before running the model on this batch
+                schedule()
+                
+                for item, result in zip([item for item, _ in batch], self._predict_prepared(batch, tta_mode)):
+                    if isinstance(item, str):
+                        result['image_path'] = item
+                    yield result
+    
+    def _predict_prepared(self, batch, tta_mode):
+        """Collate decoded futures into one tensor and predict them together"""
+        results = [None] * len(batch)
+        images, positions = [], []
+        
+        for i, (_, future) in enumerate(batch):
+            if self.model is None:
+                results[i] = self.no_model_result()
+                continue
+            try:
+                images.append(future.result())
+                positions.append(i)
+            except Exception as e:
+                results[i] = self.error_result(e)
+        
+        if images:
+            try:
+                with metrics.stage('preprocess'):
+                    tensors = self.normalize_stack(images, out=self.input_buffer(len(images)))
+                predictions = self.predict_tensors(tensors, tta_mode)
+            except Exception as e:
+                predictions = [self.error_result(e) for _ in images]
+            for i, prediction in zip(positions, predictions):
+                results[i] = prediction
         
         return results
     
@@ -248,49 +593,339 @@ class AdvancedPredictor:
             'severity': 'Unknown'
         })
     
-    def analyze_comprehensive(self, image):
+    def analyze_comprehensive(self, image, tta_mode=None):
         """Comprehensive analysis with disease details"""
-        prediction = self.predict_single(image)
-        
+        return self.add_disease_info(self.predict_single(image, tta_mode))
+    
+    def add_disease_info(self, prediction):
+        """Attach disease details to a successful prediction"""
         if prediction['confidence'] > 0:
             disease_info = self.get_disease_info(prediction['disease'])
             prediction.update(disease_info)
         
         return prediction
 
+class CascadePredictor(AdvancedPredictor):
+    """Two-stage inference: a small model first, the full model with TTA only when it is unsure.
+    
+    The first stage (e.g. efficientnet-b0) runs once per image without
+    TTA. Images whose top-1 probability and top-1/top-2 margin clear the
+    cascade bounds are answered from it; the rest are escalated to the
+    full predictor with its TTA mode. Both stages must share one class
+    mapping. Without a loadable first stage every image goes to the full
+    model, as with a plain AdvancedPredictor.
+    """
+    
+    def __init__(self, fast_model_path='models/fast/', fast_model_name='efficientnet-b0',
+                 cascade_confidence=0.85, cascade_margin=0.5, **kwargs):
+        super().__init__(**kwargs)
+        self.fast_model_path = fast_model_path
+        self.fast_model_name = fast_model_name
+        self.cascade_confidence = cascade_confidence
+        self.cascade_margin = cascade_margin
+        
+        self._stats_lock = threading.Lock()
+        self.fast_answers = 0
+        self.escalations = 0
+        
+        self.fast = AdvancedPredictor(
+            model_path=fast_model_path,
+            tta_mode='none',
+            inference_mode=self.inference_mode,
+            model_name=fast_model_name,
+            class_mapping_file=self.class_mapping_file or os.path.join(self.model_path, 'class_mapping.json'),
+            snapshot_dir=self.snapshot_dir
+        )
+        if self.fast.model is not None and self.fast.classes != self.classes:
+            print("WARNING: Cascade first stage has a different class mapping - cascade disabled")
+            self.fast.model = None
+        if self.model is not None and self.fast.model is not None:
+            # Both checkpoints decide a result, so both identify it in cache keys
+            self.model_version = f"{self.model_version}+{self.fast.model_version}"
+    
+    def init_kwargs(self):
+        return dict(
+            super().init_kwargs(),
+            fast_model_path=self.fast_model_path,
+            fast_model_name=self.fast_model_name,
+            cascade_confidence=self.cascade_confidence,
+            cascade_margin=self.cascade_margin
+        )
+    
+    def result_settings(self):
+        return f"{super().result_settings()},cascade={self.cascade_confidence:g}/{self.cascade_margin:g}"
+    
+    def pinned_init_kwargs(self):
+        kwargs = super().pinned_init_kwargs()
+        if self.fast.snapshot_path is not None:
+            kwargs['fast_model_path'] = self.fast.snapshot_path
+        return kwargs
+    
+    def release_snapshot(self):
+        super().release_snapshot()
+        self.fast.release_snapshot()
+    
+    def predict_tensors(self, batch, tta_mode=None):
+        """First-stage answers for confident images, full model plus TTA for the rest, in input order"""
+        if self.fast.model is None:
+            return super().predict_tensors(batch, tta_mode)
+        
+        batch = batch.to(self.device)
+        probs = torch.softmax(self.fast.forward(batch), dim=1)
+        top = probs.topk(min(2, probs.shape[1]), dim=1)
+        margin = top.values[:, 0] - top.values[:, 1] if top.values.shape[1] > 1 else top.values[:, 0]
+        confident = (top.values[:, 0] >= self.cascade_confidence) & (margin >= self.cascade_margin)
+        
+        # Which stage answered, and how sure the first stage was either way
+        first_stage = top.values[:, 0].tolist()
+        results = [None] * batch.shape[0]
+        for i in confident.nonzero().flatten().tolist():
+            results[i] = dict(self.format_prediction(top.indices[i, 0].item(), first_stage[i], 1),
+                              cascade_stage='fast', first_stage_confidence=first_stage[i] * 100)
+        
+        escalated = (~confident).nonzero().flatten()
+        if escalated.numel() > 0:
+            for i, result in zip(escalated.tolist(), super().predict_tensors(batch[escalated], tta_mode)):
+                results[i] = dict(result, cascade_stage='full', first_stage_confidence=first_stage[i] * 100)
+        
+        metrics.count('cascade_escalations_total', escalated.numel())
+        with self._stats_lock:
+            self.escalations += escalated.numel()
+            self.fast_answers += batch.shape[0] - escalated.numel()
+        return results
+    
+    def cascade_stats(self):
+        with self._stats_lock:
+            total = self.fast_answers + self.escalations
+            return {
+                'enabled': self.fast.model is not None,
+                'fast_model': self.fast.model_name,
+                'cascade_confidence': self.cascade_confidence,
+                'cascade_margin': self.cascade_margin,
+                'images': total,
+                'fast_answers': self.fast_answers,
+                'escalations': self.escalations,
+                'escalation_rate': round(self.escalations / total, 4) if total else 0
+            }
+
+def export_bundle(model_path='models/', output_file=None):
+    """Write best_model.pth and class_mapping.json as one self-contained bundle"""
+    output_file = output_file or os.path.join(model_path, BUNDLE_FILENAME)
+    
+    with open(os.path.join(model_path, 'class_mapping.json'), 'r') as f:
+        class_data = json.load(f)
+    checkpoint = torch.load(os.path.join(model_path, 'best_model.pth'), map_location='cpu')
+    state_dict = checkpoint.get('model_state_dict', checkpoint)
+    
+    bundle = {
+        'format_version': 1,
+        'model_name': class_data.get('model_name', 'efficientnet-b2'),
+        'num_classes': class_data['num_classes'],
+        'classes': class_data['classes'],
+        'class_to_idx': class_data['class_to_idx'],
+        'model_state_dict': state_dict
+    }
+    if 'accuracy' in checkpoint:
+        bundle['accuracy'] = checkpoint['accuracy']
+    
+    torch.save(bundle, output_file)
+    return output_file
+
 # Integration with existing Flask app
 class EnhancedFruitDiseaseDetector:
-    def __init__(self):
-        self.predictor = AdvancedPredictor()
+    def __init__(self, predictor=None, micro_batching=False, max_batch=8, max_wait_ms=5.0, cache=None,
+                 inference_workers=0, inference_timeout=30.0, inference_startup_timeout=300.0):
+        self.predictor = predictor or AdvancedPredictor()
+        
+        # Optional scheduler that merges concurrent requests into one forward,
+        # or a pool of inference processes behind the same interface
+        self.scheduler = None
+        self.inference_workers = inference_workers
+        if inference_workers > 0:
+            from inference_pool import InferencePool
+            self.scheduler = InferencePool(self.predictor, workers=inference_workers,
+                                           timeout=inference_timeout, max_batch=max_batch,
+                                           startup_timeout=inference_startup_timeout)
+        elif micro_batching:
+            from inference_queue import MicroBatchScheduler
+            self.scheduler = MicroBatchScheduler(self.predictor, max_batch=max_batch, max_wait_ms=max_wait_ms)
+        
+        # Optional PredictionCache of formatted analyses keyed on image content
+        self.cache = cache
+        # Odd while a swap is in progress; results are only cached when it did not change meanwhile
+        self._swap_generation = 0
     
-    def analyze_image(self, image_array):
-        """Enhanced analysis for Flask app integration"""
+    def swap_predictor(self, predictor):
+        """Switch to another predictor and return the previous one.
+        
+        Requests already running keep their reference to the old predictor
+        and finish on it; new requests see only the new one. While an
+        inference pool restarts its workers some of them already run the
+        new weights under the old predictor's cache key, so nothing is
+        cached until the swap is over.
+        """
+        self._swap_generation += 1
         try:
-            # Use advanced predictor
-            result = self.predictor.analyze_comprehensive(image_array)
-            
-            # Format prediction string
-            prediction = f"{result['fruit']}_{result['disease'].lower().replace(' ', '_')}"
-            confidence = f"{result['confidence']:.1f}%"
+            if self.scheduler is not None:
+                self.scheduler.swap_predictor(predictor)
+            previous, self.predictor = self.predictor, predictor
+        finally:
+            self._swap_generation += 1
+        return previous
+    
+    def analyze_image(self, image_array, tta_mode=None, use_cache=True):
+        """Enhanced analysis for Flask app integration.
+        
+        use_cache=False skips the prediction cache, for images such as
+        camera frames that are never byte-identical.
+        """
+        try:
+            generation = self._swap_generation
+            key = self.cache_key(image_array, tta_mode) if use_cache else None
+            if key is not None:
+                with metrics.stage('cache_lookup'):
+                    cached = self.cache.get(key)
+                if cached is not None:
+                    metrics.count('cache_hits_total')
+                    cached['cached'] = True
+                    return cached
+                metrics.count('cache_misses_total')
             
-            # Return dictionary format expected by Flask app
-            return {
-                'prediction': prediction,
-                'confidence': confidence,
-                'fruit': result['fruit'],
-                'disease': result['disease'],
-                'is_healthy': result['is_healthy'],
-                'description': result.get('description', ''),
-                'treatment': result.get('treatment', ''),
-                'severity': result.get('severity', 'Unknown')
-            }
+            result = self.predict(image_array, tta_mode)
+            return self.store_analysis(key, result, generation)
             
         except Exception as e:
-            return {
-                'prediction': 'unknown_error',
-                'confidence': '0.0%',
-                'fruit': 'Unknown',
-                'disease': 'Analysis Failed',
-                'is_healthy': False,
-                'error': str(e)
-            }
\ No newline at end of file
+            return self.error_analysis(e)
+    
+    def analyze_batch(self, images, batch_size=16, tta_mode=None):
+        """Analyze many images through the batch engine, yielding in input order.
+        
+        Exactly one analysis is yielded per image: an image that fails gets
+        an error analysis and the rest are still analyzed.
+        """
+        images = list(images)
+        generation = self._swap_generation
+        try:
+            keys = [self.cache_key(image, tta_mode) for image in images]
+            cached = [self.cache.get(key) if key is not None else None for key in keys]
+        except Exception:
+            keys, cached = [None] * len(images), [None] * len(images)
+        
+        # Only cache misses go through the model
+        misses = [image for image, hit in zip(images, cached) if hit is None]
+        results = self._predict_many(misses, batch_size, tta_mode)
+        done = 0
+        
+        for key, hit in zip(keys, cached):
+            if hit is not None:
+                metrics.count('cache_hits_total')
+                hit['cached'] = True
+                yield hit
+                continue
+            
+            if key is not None:
+                metrics.count('cache_misses_total')
+            try:
+                result = next(results)
+            except Exception as e:
+                # A generator that raised is finished: this image fails, the ones after it start over
+                done += 1
+                results = self._predict_many(misses[done:], batch_size, tta_mode)
+                yield self.error_analysis(e)
+                continue
+            done += 1
+            
+            try:
+                analysis = self.store_analysis(key, result, generation)
+            except Exception as e:
+                analysis = self.error_analysis(e)
+            yield analysis
+    
+    def _predict_many(self, images, batch_size, tta_mode):
+        """Raw predictor results for images, in input order.
+        
+        A batch already fills its forward passes, so only the inference
+        pool, where the model runs, sees it; micro-batching is bypassed
+        in favour of predict_batch and its pipelined decoding.
+        """
+        if self.inference_workers > 0:
+            return self._schedule_batch(images, batch_size, tta_mode)
+        return self.predictor.predict_batch(images, batch_size=batch_size, tta_mode=tta_mode)
+    
+    def predict(self, image_array, tta_mode=None):
+        """Raw predictor result, through the micro-batching scheduler when enabled"""
+        if self.scheduler is not None:
+            return self.scheduler.predict(image_array, tta_mode)
+        return self.predictor.predict_single(image_array, tta_mode)
+    
+    def cache_key(self, image_array, tta_mode=None):
+        """Cache key for a decoded image, or None when the result must not be cached"""
+        if self.cache is None or self.predictor.model is None or not isinstance(image_array, np.ndarray):
+            return None
+        if self._swap_generation % 2:
+            return None
+        # Everything that decides the result, so the disk tier never serves one computed under other settings
+        model_version = (f"{self.predictor.model_version}:{self.predictor.inference_mode}:"
+                         f"{self.predictor.result_settings()}")
+        return self.cache.key_for(image_array, model_version, tta_mode or self.predictor.tta_mode)
+    
+    def store_analysis(self, key, result, generation=None):
+        """Format a predictor result and cache it when it is a real prediction.
+        
+        generation is the swap generation when key was computed; a result
+        that may come from a model swapped in since then is not cached.
+        """
+        analysis = self.format_analysis(self.predictor.add_disease_info(result))
+        if 'error' in result:
+            metrics.count('prediction_errors_total')
+            return analysis
+        
+        metrics.count('predictions_total')
+        if key is not None and generation in (None, self._swap_generation):
+            self.cache.put(key, analysis)
+        return analysis
+    
+    def _schedule_batch(self, images, batch_size, tta_mode):
+        """Feed images through the inference pool with a bounded number in flight"""
+        pending = deque()
+        for image in images:
+            pending.append(self.scheduler.submit(image, tta_mode))
+            if len(pending) >= batch_size * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    
+    def format_analysis(self, result):
+        """Convert a predictor result into the dictionary format expected by Flask app"""
+        # Format prediction string
+        prediction = f"{result['fruit']}_{result['disease'].lower().replace(' ', '_')}"
+        confidence = f"{result['confidence']:.1f}%"
+        
+        analysis = {
+            'prediction': prediction,
+            'confidence': confidence,
+            'fruit': result['fruit'],
+            'disease': result['disease'],
+            'is_healthy': result['is_healthy'],
+            'description': result.get('description', ''),
+            'treatment': result.get('treatment', ''),
+            'severity': result.get('severity', 'Unknown'),
+            'tta_passes': result.get('tta_passes', 0)
+        }
+        # Cascade results say which stage answered ('fast' or 'full')
+        if 'cascade_stage' in result:
+            analysis['cascade_stage'] = result['cascade_stage']
+            analysis['first_stage_confidence'] = f"{result['first_stage_confidence']:.1f}%"
+        return analysis
+    
+    def error_analysis(self, error):
+        """Analysis returned when the predictor itself raised"""
+        metrics.count('prediction_errors_total')
+        return {
+            'prediction': 'unknown_error',
+            'confidence': '0.0%',
+            'fruit': 'Unknown',
+            'disease': 'Analysis Failed',
+            'is_healthy': False,
+            'error': str(error)
+        }
@@ -1,72 +1,94 @@
-from flask import Flask, render_template, request, jsonify, redirect, url_for
+from flask import Flask, render_template, request, jsonify, redirect, url_for, send_file, send_from_directory, stream_with_context
 import cv2
 import numpy as np
 import base64
 from io import BytesIO
 from PIL import Image
 import os
-from advanced_predictor import EnhancedFruitDiseaseDetector
+from advanced_predictor import AdvancedPredictor, CascadePredictor, EnhancedFruitDiseaseDetector
 from database import AnalysisDatabase
+from prediction_cache import PredictionCache
+from live_session import LiveSessionTracker, FramePacer
+from upload_writer import UploadWriter
+from derivatives import DerivativeStore, DERIVATIVE_KINDS
 from feedback_system import FeedbackSystem
+from metrics import metrics
+from model_manager import ModelManager
+from corrections import CorrectionStore
 import uuid
 from datetime import datetime
 import json
+import tempfile
+import time
+import config
+
+try:
+    from flask_sock import Sock
+except ImportError:  # live detection falls back to HTTP polling of /live_detect
+    Sock = None
 
 app = Flask(__name__, template_folder='web/templates', static_folder='web/static')
+sock = Sock(app) if Sock is not None else None
+metrics.configure(enabled=config.METRICS, server_timing=config.SERVER_TIMING)
+
+@app.before_request
+def begin_request_metrics():
+    metrics.begin_request(request.url_rule.rule if request.url_rule else 'unmatched')
+    # Per process, so each prefork worker watches for new checkpoints itself
+    model_manager.ensure_watching()
+
+@app.after_request
+def end_request_metrics(response):
+    server_timing = metrics.end_request(response.status_code)
+    if server_timing:
+        response.headers['Server-Timing'] = server_timing
+    return response
 
 # Create necessary directories
-os.makedirs('web/static/uploads', exist_ok=True)
-os.makedirs('models', exist_ok=True)
-
-def generate_processed_images(img_array, original_filename):
-    """Generate and save processed versions of the image"""
-    processed = {}
-    base_name = original_filename.split('.')[0]
-
-    # Original
-    processed['original'] = original_filename
-
-    # Preprocessed - resize to 224x224
-    preprocessed = cv2.resize(img_array, (224, 224))
-    prep_filename = f"{base_name}_preprocessed.jpg"
-    cv2.imwrite(os.path.join('web/static/uploads', prep_filename), cv2.cvtColor(preprocessed, cv2.COLOR_RGB2BGR))
-    processed['preprocessed'] = prep_filename
-
-    # Rotated - 90 degrees clockwise
-    rotated = cv2.rotate(img_array, cv2.ROTATE_90_CLOCKWISE)
-    rot_filename = f"{base_name}_rotated.jpg"
-    cv2.imwrite(os.path.join('web/static/uploads', rot_filename), cv2.cvtColor(rotated, cv2.COLOR_RGB2BGR))
-    processed['rotated'] = rot_filename
-
-    # Blurred - Gaussian blur
-    blurred = cv2.GaussianBlur(img_array, (5, 5), 0)
-    blur_filename = f"{base_name}_blurred.jpg"
-    cv2.imwrite(os.path.join('web/static/uploads', blur_filename), cv2.cvtColor(blurred, cv2.COLOR_RGB2BGR))
-    processed['blurred'] = blur_filename
-
-    # Cropped - center crop
-    h, w = img_array.shape[:2]
-    crop_size = min(h, w) // 2
-    start_x = (w - crop_size) // 2
-    start_y = (h - crop_size) // 2
-    cropped = img_array[start_y:start_y+crop_size, start_x:start_x+crop_size]
-    crop_filename = f"{base_name}_cropped.jpg"
-    cv2.imwrite(os.path.join('web/static/uploads', crop_filename), cv2.cvtColor(cropped, cv2.COLOR_RGB2BGR))
-    processed['cropped'] = crop_filename
-
-    # Edges - Canny edge detection
-    gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
-    edges = cv2.Canny(gray, 100, 200)
-    edges_colored = cv2.cvtColor(edges, cv2.COLOR_GRAY2RGB)
-    edges_filename = f"{base_name}_edges.jpg"
-    cv2.imwrite(os.path.join('web/static/uploads', edges_filename), edges_colored)
-    processed['edges'] = edges_filename
-
-    return processed
+os.makedirs(config.UPLOAD_DIR, exist_ok=True)
+os.makedirs(config.MODEL_PATH, exist_ok=True)
+
+def processed_image_urls(filename):
+    """URLs of the processed views of an upload; each is rendered the first time it is requested"""
+    return {kind: url_for('derivative_file', kind=kind, filename=filename) for kind in DERIVATIVE_KINDS}
+
+def load_upload(filename):
+    """Decoded RGB array of an upload, whether or not it has reached disk yet"""
+    data = upload_writer.pending(filename)
+    if data is None:
+        with open(os.path.join(upload_writer.upload_dir, os.path.basename(filename)), 'rb') as f:
+            data = f.read()
+    return decode_upload(data)
+
+def decode_upload(data):
+    """Decode uploaded image bytes straight from memory into an RGB array"""
+    img = Image.open(BytesIO(data))
+    img_array = np.array(img)
+    
+    # Convert to RGB if needed
+    if len(img_array.shape) == 3 and img_array.shape[2] == 4:
+        img_array = cv2.cvtColor(img_array, cv2.COLOR_RGBA2RGB)
+    return img_array
 
 @app.route('/static/uploads/<filename>')
 def uploaded_file(filename):
-    return app.send_static_file(f'uploads/{filename}')
+    # Uploads still queued for the background writer are served from memory
+    data = upload_writer.pending(filename)
+    if data is not None:
+        return send_file(BytesIO(data), mimetype='image/jpeg')
+    return send_from_directory(upload_writer.upload_dir, filename)
+
+@app.route('/derivatives/<kind>/<filename>')
+def derivative_file(kind, filename):
+    if kind not in DERIVATIVE_KINDS:
+        return jsonify({'error': 'Unknown derivative'}), 404
+    try:
+        return send_file(derivative_store.path_for(filename, kind), mimetype='image/jpeg', max_age=86400)
+    except FileNotFoundError:
+        return jsonify({'error': 'Image not found'}), 404
+    except ValueError:
+        # The upload exists but is not an image the processed views can be rendered from
+        return jsonify({'error': 'Image not readable'}), 404
 
 @app.route('/correct_prediction', methods=['POST'])
 def correct_prediction():
@@ -75,27 +97,12 @@ def correct_prediction():
         correct_fruit = request.form.get('correct_fruit')
         correct_condition = request.form.get('correct_condition')
         
-        # Save correction to database or file for retraining
-        correction_data = {
-            'filename': filename,
-            'original_prediction': request.form.get('original_prediction', 'unknown'),
-            'correct_fruit': correct_fruit,
-            'correct_condition': correct_condition,
-            'timestamp': str(datetime.now())
-        }
-        
-        # Save to corrections file
-        corrections_file = 'corrections.json'
-        corrections = []
-        
-        if os.path.exists(corrections_file):
-            with open(corrections_file, 'r') as f:
-                corrections = json.load(f)
-        
-        corrections.append(correction_data)
-        
-        with open(corrections_file, 'w') as f:
-            json.dump(corrections, f, indent=2)
+        corrections.add(
+            filename,
+            correct_fruit,
+            correct_condition,
+            original_prediction=request.form.get('original_prediction', 'unknown')
+        )
         
         return render_template('correction_success.html', 
                              correct_fruit=correct_fruit,
@@ -105,9 +112,65 @@ def correct_prediction():
         return render_template('correction_error.html', error=str(e))
 
 # Initialize enhanced disease detector and database
-detector = EnhancedFruitDiseaseDetector()
-db = AnalysisDatabase()
-feedback_system = FeedbackSystem()
+predictor_settings = dict(
+    model_path=config.MODEL_PATH,
+    tta_mode=config.TTA_MODE,
+    early_exit_confidence=config.EARLY_EXIT_CONFIDENCE,
+    early_exit_margin=config.EARLY_EXIT_MARGIN,
+    inference_mode=config.INFERENCE_MODE,
+    # Pool workers load their weights from a copy of the checkpoint taken at load time
+    snapshot_dir=(config.MODEL_SNAPSHOT_DIR or os.path.join(tempfile.gettempdir(), 'fruit-model-snapshots'))
+    if config.INFERENCE_WORKERS else None
+)
+if config.CASCADE:
+    predictor = CascadePredictor(
+        fast_model_path=config.CASCADE_MODEL_PATH,
+        fast_model_name=config.CASCADE_MODEL_NAME,
+        cascade_confidence=config.CASCADE_CONFIDENCE,
+        cascade_margin=config.CASCADE_MARGIN,
+        **predictor_settings
+    )
+else:
+    predictor = AdvancedPredictor(**predictor_settings)
+
+detector = EnhancedFruitDiseaseDetector(
+    predictor=predictor,
+    micro_batching=config.MICRO_BATCHING,
+    max_batch=config.MICRO_BATCH_MAX_SIZE,
+    max_wait_ms=config.MICRO_BATCH_MAX_WAIT_MS,
+    inference_workers=config.INFERENCE_WORKERS,
+    inference_timeout=config.INFERENCE_TIMEOUT,
+    inference_startup_timeout=config.INFERENCE_STARTUP_TIMEOUT,
+    cache=PredictionCache(
+        max_entries=config.PREDICTION_CACHE_SIZE,
+        cache_dir=config.PREDICTION_CACHE_DIR or None,
+        max_disk_mb=config.PREDICTION_CACHE_DISK_MB
+    ) if config.PREDICTION_CACHE else None
+)
+model_manager = ModelManager(
+    detector,
+    watch_interval=config.MODEL_WATCH_INTERVAL,
+    warmup_runs=config.MODEL_WARMUP_RUNS
+)
+live_sessions = LiveSessionTracker(
+    change_threshold=config.LIVE_CHANGE_THRESHOLD,
+    refresh_every=config.LIVE_REFRESH_EVERY,
+    session_ttl=config.LIVE_SESSION_TTL
+)
+frame_pacer = FramePacer(
+    min_interval_ms=config.LIVE_MIN_FRAME_MS,
+    max_interval_ms=config.LIVE_MAX_FRAME_MS
+)
+upload_writer = UploadWriter(config.UPLOAD_DIR)
+derivative_store = DerivativeStore(
+    load_upload,
+    cache_dir=config.DERIVATIVE_CACHE_DIR,
+    max_disk_mb=config.DERIVATIVE_CACHE_MB,
+    workers=config.DERIVATIVE_WORKERS
+)
+db = AnalysisDatabase(config.DATABASE_FILE, backend=config.DATABASE_BACKEND)
+feedback_system = FeedbackSystem(journal_file=config.FEEDBACK_JOURNAL)
+corrections = CorrectionStore(journal_file=config.CORRECTIONS_JOURNAL)
 
 @app.route('/')
 def index():
@@ -124,7 +187,7 @@ def analyze():
 
 @app.route('/live-detection')
 def live_detection():
-    return render_template('live_detection_page.html')
+    return render_template('live_detection_page.html', live_socket=sock is not None)
 
 @app.route('/live')
 def live():
@@ -155,23 +218,38 @@ def batch_predict():
         if not files:
             return jsonify({'success': False, 'error': 'No files uploaded'})
         
-        results = []
+        # Save and decode every upload, then score them through the batch engine
+        uploads = []
         for file in files:
             if file.filename == '':
                 continue
             
-            # Save file
+            # Decode from memory; the original is saved in the background
             filename = str(uuid.uuid4()) + '.jpg'
-            upload_path = os.path.join('web/static/uploads', filename)
-            file.save(upload_path)
+            with metrics.stage('read_upload'):
+                data = file.read()
+                upload_writer.submit(filename, data)
+            with metrics.stage('decode'):
+                img_array = decode_upload(data)
             
-            # Analyze
-            img = Image.open(upload_path)
-            img_array = np.array(img)
-            if len(img_array.shape) == 3 and img_array.shape[2] == 4:
-                img_array = cv2.cvtColor(img_array, cv2.COLOR_RGBA2RGB)
+            uploads.append((file.filename, filename, img_array))
+        
+        results = []
+        analyses = detector.analyze_batch([img_array for _, _, img_array in uploads], batch_size=config.BATCH_SIZE)
+        for (original_name, filename, _), analysis in zip(uploads, analyses):
+            # No result or record may point at an upload that never reached disk
+            if not upload_writer.confirm(filename):
+                results.append({
+                    'filename': original_name,
+                    'fruit': 'Unknown',
+                    'condition': 'Upload Failed',
+                    'confidence': '0%',
+                    'is_healthy': False,
+                    'image_url': None,
+                    'error': 'Could not save the upload'
+                })
+                continue
             
-            analysis = detector.analyze_image(img_array)
             prediction = analysis.get('prediction', 'unknown')
             
             if '_' in prediction:
@@ -180,17 +258,19 @@ def batch_predict():
                 fruit, condition = prediction, 'unknown'
             
             results.append({
-                'filename': file.filename,
+                'filename': original_name,
                 'saved_as': filename,
                 'fruit': fruit.title(),
                 'condition': condition.title(),
                 'confidence': analysis.get('confidence', '0%'),
                 'is_healthy': 'healthy' in condition.lower(),
-                'image_url': f'/static/uploads/{filename}'
+                'image_url': f'/static/uploads/{filename}',
+                'cascade_stage': analysis.get('cascade_stage')
             })
             
             # Save to database
-            db.add_analysis(fruit, condition, analysis.get('confidence', '0%'), filename)
+            with metrics.stage('database'):
+                db.add_analysis(fruit, condition, analysis.get('confidence', '0%'), filename)
         
         return jsonify({'success': True, 'results': results})
     except Exception as e:
@@ -207,26 +287,24 @@ def predict():
         if file.filename == '':
             return jsonify({'success': False, 'error': 'No file selected'})
         
-        # Save uploaded file
+        # Read image for analysis straight from the upload; the original
+        # is saved to web/static/uploads in the background
         filename = str(uuid.uuid4()) + '.jpg'
-        upload_path = os.path.join('web/static/uploads', filename)
-        os.makedirs('web/static/uploads', exist_ok=True)
-        file.save(upload_path)
-        
-        # Read image for analysis
-        img = Image.open(upload_path)
-        img_array = np.array(img)
-
-        # Convert to RGB if needed
-        if len(img_array.shape) == 3 and img_array.shape[2] == 4:
-            img_array = cv2.cvtColor(img_array, cv2.COLOR_RGBA2RGB)
+        with metrics.stage('read_upload'):
+            data = file.read()
+            upload_writer.submit(filename, data)
+        with metrics.stage('decode'):
+            img_array = decode_upload(data)
 
-        # Generate processed images
-        processed_images = generate_processed_images(img_array, filename)
+        # Processed views are rendered lazily by /derivatives, or pre-generated in the background
+        with metrics.stage('derivatives'):
+            processed_images = processed_image_urls(filename)
+            derivative_store.pregenerate(filename, img_array)
 
         # Analyze image for fruits and diseases
         try:
-            results = detector.analyze_image(img_array)
+            with metrics.stage('analyze'):
+                results = detector.analyze_image(img_array)
         except Exception as analysis_error:
             print(f"Analysis error: {analysis_error}")
             # Fallback result
@@ -257,34 +335,57 @@ def predict():
         is_healthy = 'healthy' in condition.lower()
         is_other = condition.lower() in ['unknown', 'other']
         
+        # The record and the result page both point at the upload, so it must be on disk
+        if not upload_writer.confirm(filename):
+            return jsonify({'success': False, 'error': 'Could not save the upload'})
+        
         # Save to database
-        db.add_analysis(fruit, condition, confidence, filename)
+        with metrics.stage('database'):
+            db.add_analysis(fruit, condition, confidence, filename)
+        
+        # API clients asking for JSON get the analysis instead of the result page
+        if request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json':
+            return jsonify({
+                'success': True,
+                'filename': filename,
+                'image_url': f'/static/uploads/{filename}',
+                'processed_images': processed_images,
+                'prediction': prediction,
+                'fruit': fruit,
+                'condition': condition,
+                'confidence': confidence,
+                'is_healthy': is_healthy,
+                'tta_passes': results.get('tta_passes', 0),
+                'cascade_stage': results.get('cascade_stage'),
+                'first_stage_confidence': results.get('first_stage_confidence')
+            })
         
         # Render result page
-        return render_template('result.html',
-            image_url=f'/static/uploads/{processed_images["original"]}',
-            prep_url=f'/static/uploads/{processed_images["preprocessed"]}',
-            previews={
-                'Rotated': processed_images['rotated'],
-                'Blurred': processed_images['blurred'],
-                'Cropped': processed_images['cropped'],
-                'Edges': processed_images['edges']
-            },
-            label=prediction,
-            fruit=fruit.title(),
-            condition=condition.title(),
-            confidence=confidence,
-            is_healthy=is_healthy,
-            is_other=is_other,
-            infection_type=condition if not is_healthy else 'None',
-            model_used='EfficientNet',
-            is_ai_generated=False,
-            ai_confidence='N/A',
-            filename=filename,
-            available_fruits=['apple', 'tomato', 'potato', 'grape', 'corn'],
-            available_conditions=['healthy', 'diseased'],
-            predicted_fruit=fruit
-        )
+        with metrics.stage('render'):
+            return render_template('result.html',
+                image_url=f'/static/uploads/{filename}',
+                prep_url=processed_images['preprocessed'],
+                previews={
+                    'Rotated': processed_images['rotated'],
+                    'Blurred': processed_images['blurred'],
+                    'Cropped': processed_images['cropped'],
+                    'Edges': processed_images['edges']
+                },
+                label=prediction,
+                fruit=fruit.title(),
+                condition=condition.title(),
+                confidence=confidence,
+                is_healthy=is_healthy,
+                is_other=is_other,
+                infection_type=condition if not is_healthy else 'None',
+                model_used='EfficientNet',
+                is_ai_generated=False,
+                ai_confidence='N/A',
+                filename=filename,
+                available_fruits=['apple', 'tomato', 'potato', 'grape', 'corn'],
+                available_conditions=['healthy', 'diseased'],
+                predicted_fruit=fruit
+            )
         
     except Exception as e:
         return jsonify({
@@ -293,6 +394,127 @@ def predict():
         })
 
 
+def analyze_live_frame(img_array, session_id):
+    """Analyze a live camera frame, reusing the session's last result while the scene is unchanged"""
+    # Resize to standard size for better accuracy (same as upload preprocessing)
+    img_array = cv2.resize(img_array, (512, 512))
+    
+    frame_hash = live_sessions.frame_hash(img_array)
+    action, last_results = live_sessions.check(session_id, frame_hash)
+    metrics.count('live_frames_total', action=action)
+    if action == 'reuse':
+        return last_results, img_array
+    
+    # Apply slight denoising for camera images
+    img_array = cv2.bilateralFilter(img_array, 9, 75, 75)
+    
+    # Frames are never byte-identical, so the content-addressed prediction cache
+    # would only hash them and evict real uploads; the session reuse above covers it
+    if action == 'refresh':
+        # Same scene: one non-TTA pass keeps the running average current
+        results = live_sessions.refresh(
+            session_id, frame_hash, detector.analyze_image(img_array, tta_mode='none', use_cache=False)
+        )
+        if results is not None:
+            return results, img_array
+    
+    # Enhanced analysis for live detection
+    results = detector.analyze_image(img_array, use_cache=False)
+    live_sessions.record(session_id, frame_hash, results)
+    return results, img_array
+
+def live_detection_response(results, img_array):
+    """Build the /live_detect JSON payload for an analysis"""
+    prediction = results.get('prediction', 'unknown')
+    confidence = results.get('confidence', '0%')
+    
+    # Check confidence
+    confidence_num = float(confidence.replace('%', '')) if '%' in confidence else 0
+    if confidence_num < 30:
+        return {
+            'success': True,
+            'description': '📷 Point camera at fruits or vegetables',
+            'has_fruit': False,
+            'objects': [],
+            'should_speak': False
+        }
+    
+    if '_' in prediction:
+        fruit, condition = prediction.split('_', 1)
+    else:
+        fruit = prediction
+        condition = 'detected'
+    
+    # Dynamic bounding box based on image size
+    img_height, img_width = img_array.shape[:2]
+    box_width = min(img_width * 0.7, 350)
+    box_height = min(img_height * 0.7, 350)
+    box_x = (img_width - box_width) // 2
+    box_y = (img_height - box_height) // 2
+    
+    description = f"🍎 {fruit.title()} - {condition.title()} ({confidence})"
+    
+    return {
+        'success': True,
+        'description': description,
+        'has_fruit': True,
+        'objects': [{
+            'object': f"{fruit.title()} ({condition.title()})",
+            'confidence': confidence_num / 100,
+            'bbox': [box_x, box_y, box_x + box_width, box_y + box_height]
+        }],
+        'should_speak': confidence_num > 60
+    }
+
+def live_analyzing_response():
+    """Payload sent while a frame could not be analyzed yet"""
+    return {
+        'success': True,
+        'description': 'Analyzing...',
+        'has_fruit': False,
+        'objects': [],
+        'should_speak': False
+    }
+
+def live_stream(ws):
+    """Persistent live detection channel.
+    
+    The client sends JPEG frames as binary messages and gets back the same
+    JSON as /live_detect for each analyzed frame, plus next_frame_ms. Frames
+    that arrive while one is being analyzed are superseded by the newest.
+    """
+    session_id = request.args.get('session_id') or request.remote_addr
+    frame_pacer.open()
+    try:
+        while True:
+            frame = ws.receive()
+            # Latest frame wins: drop anything older than the newest frame already received
+            while True:
+                newer = ws.receive(timeout=0)
+                if newer is None:
+                    break
+                frame = newer
+                frame_pacer.drop()
+            if not isinstance(frame, (bytes, bytearray)):
+                continue
+            
+            start = time.perf_counter()
+            try:
+                # imdecode yields the same channel order /live_detect ends up with
+                img_array = cv2.imdecode(np.frombuffer(frame, np.uint8), cv2.IMREAD_COLOR)
+                results, img_array = analyze_live_frame(img_array, session_id)
+                response = live_detection_response(results, img_array)
+            except Exception:
+                response = live_analyzing_response()
+            
+            response['next_frame_ms'] = frame_pacer.record((time.perf_counter() - start) * 1000)
+            ws.send(json.dumps(response))
+    finally:
+        frame_pacer.close()
+
+if sock is not None:
+    sock.route('/ws/live_detect')(live_stream)
+
 @app.route('/live_detect', methods=['POST'])
 def live_detect():
     try:
@@ -304,151 +526,225 @@ def live_detect():
             return jsonify({'success': False, 'error': 'No file selected'})
         
         # Read and preprocess image same as upload section
-        img = Image.open(file)
-        img_array = np.array(img)
-        
-        # Convert to RGB if needed
-        if len(img_array.shape) == 3 and img_array.shape[2] == 4:
-            img_array = cv2.cvtColor(img_array, cv2.COLOR_RGBA2RGB)
-        elif len(img_array.shape) == 3 and img_array.shape[2] == 3:
-            # Ensure RGB format
-            img_array = cv2.cvtColor(img_array, cv2.COLOR_BGR2RGB)
-        
-        # Resize to standard size for better accuracy (same as upload preprocessing)
-        img_array = cv2.resize(img_array, (512, 512))
+        with metrics.stage('decode'):
+            img = Image.open(file)
+            img_array = np.array(img)
+            
+            # Convert to RGB if needed
+            if len(img_array.shape) == 3 and img_array.shape[2] == 4:
+                img_array = cv2.cvtColor(img_array, cv2.COLOR_RGBA2RGB)
+            elif len(img_array.shape) == 3 and img_array.shape[2] == 3:
+                # Ensure RGB format
+                img_array = cv2.cvtColor(img_array, cv2.COLOR_BGR2RGB)
         
-        # Apply slight denoising for camera images
-        img_array = cv2.bilateralFilter(img_array, 9, 75, 75)
+        # Frames from the same camera session share temporal state
+        session_id = request.form.get('session_id') or request.remote_addr
         
-        # Enhanced analysis for live detection
+        start = time.perf_counter()
         try:
-            results = detector.analyze_image(img_array)
-            prediction = results.get('prediction', 'unknown')
-            confidence = results.get('confidence', '0%')
-            
-            # Check confidence
-            confidence_num = float(confidence.replace('%', '')) if '%' in confidence else 0
-            if confidence_num < 30:
-                return jsonify({
-                    'success': True,
-                    'description': '📷 Point camera at fruits or vegetables',
-                    'has_fruit': False,
-                    'objects': [],
-                    'should_speak': False
-                })
-            
-            has_fruit = True
-            
-            if '_' in prediction:
-                fruit, condition = prediction.split('_', 1)
-            else:
-                fruit = prediction
-                condition = 'detected'
-            
-            is_healthy = 'healthy' in condition.lower()
-                
-            # Dynamic bounding box based on image size
-            img_height, img_width = img_array.shape[:2]
-            box_width = min(img_width * 0.7, 350)
-            box_height = min(img_height * 0.7, 350)
-            box_x = (img_width - box_width) // 2
-            box_y = (img_height - box_height) // 2
-            
-            description = f"🍎 {fruit.title()} - {condition.title()} ({confidence})"
-            
-            return jsonify({
-                'success': True,
-                'description': description,
-                'has_fruit': True,
-                'objects': [{
-                    'object': f"{fruit.title()} ({condition.title()})",
-                    'confidence': confidence_num / 100,
-                    'bbox': [box_x, box_y, box_x + box_width, box_y + box_height]
-                }],
-                'should_speak': confidence_num > 60
-            })
+            results, img_array = analyze_live_frame(img_array, session_id)
+            response = live_detection_response(results, img_array)
             
         except Exception as e:
-            return jsonify({
-                'success': True,
-                'description': 'Analyzing...',
-                'has_fruit': False,
-                'objects': [],
-                'should_speak': False
-            })
+            response = live_analyzing_response()
+        
+        response['next_frame_ms'] = frame_pacer.record((time.perf_counter() - start) * 1000)
+        return jsonify(response)
             
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
 @app.route('/stats')
 def stats():
-    return jsonify(db.get_stats())
+    days = request.args.get('days', type=int)
+    bucket = request.args.get('bucket', 'day')
+    if bucket not in ('day', 'hour'):
+        return jsonify({'error': 'bucket must be day or hour'}), 400
+    if days is not None and not 1 <= days <= 366:
+        return jsonify({'error': 'days must be between 1 and 366'}), 400
+    return jsonify(db.get_stats(days=days, bucket=bucket))
+
+@app.route('/api/stats/rebuild', methods=['POST'])
+def rebuild_stats():
+    return jsonify(db.rebuild_stats())
+
+@app.route('/api/inference/stats')
+def inference_stats():
+    return jsonify({
+        'micro_batching': detector.scheduler.stats() if detector.scheduler and not config.INFERENCE_WORKERS else None,
+        'inference_pool': detector.scheduler.stats() if config.INFERENCE_WORKERS else None,
+        'cache': detector.cache.stats() if detector.cache else None,
+        'cascade': detector.predictor.cascade_stats() if isinstance(detector.predictor, CascadePredictor) else None,
+        'live_sessions': live_sessions.stats(),
+        'live_streams': frame_pacer.stats()
+    })
+
+@app.route('/api/model')
+def model_status():
+    return jsonify(model_manager.status())
+
+@app.route('/api/model/reload', methods=['POST'])
+def reload_model():
+    """Load a checkpoint in the background and swap it in once warmed up"""
+    model_path = (request.get_json(silent=True) or {}).get('model_path') or config.MODEL_PATH
+    
+    # Only directories inside the configured model directory can be loaded
+    root = os.path.abspath(config.MODEL_PATH)
+    if os.path.commonpath([root, os.path.abspath(model_path)]) != root:
+        return jsonify({'error': 'model_path must be inside the model directory'}), 400
+    
+    # Under serve.py the master reloads and re-forks every worker, not just this one
+    started = model_manager.request_reload(model_path)
+    return jsonify({'started': started, **model_manager.status()}), 202 if started else 409
+
+@app.route('/api/model/rollback', methods=['POST'])
+def rollback_model():
+    if not model_manager.request_rollback():
+        return jsonify({'error': 'No previous model to roll back to'}), 409
+    if model_manager.master is not None:
+        # Carried out by the prefork master; workers forked afterwards report the result
+        return jsonify({'started': True, **model_manager.status()}), 202
+    return jsonify(model_manager.status())
+
+@app.route('/metrics')
+def prometheus_metrics():
+    return app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/uploads/stats')
+def upload_stats():
+    return jsonify(dict(upload_writer.stats(), derivatives=derivative_store.stats()))
 
 @app.route('/api/history')
 def api_history():
-    return jsonify(db.get_history())
+    """Newest-first analysis history, one page at a time.
+    
+    The body stays a plain list; the next page's cursor is returned in the
+    X-Next-Cursor header (absent on the last page).
+    """
+    try:
+        limit = min(max(request.args.get('limit', 100, type=int), 1), 1000)
+        items, next_cursor = db.query_history(
+            limit=limit,
+            cursor=request.args.get('cursor'),
+            fields=request.args.get('fields', 'full'),
+            **history_filters(request.args)
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    response = jsonify(items)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+def history_filters(args):
+    """History filters from query-string arguments"""
+    return {
+        'fruit': args.get('fruit'),
+        'condition': args.get('condition'),
+        'status': args.get('status'),
+        'date_from': args.get('from'),
+        'date_to': args.get('to'),
+        'min_confidence': args.get('min_confidence'),
+        'max_confidence': args.get('max_confidence')
+    }
+
+# Streamed export formats: (mimetype, download filename)
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'fruit_analysis_history.csv'),
+    'json': ('application/json', 'fruit_analysis_history.json'),
+    'ndjson': ('application/x-ndjson', 'fruit_analysis_history.ndjson')
+}
+
+def export_record(item):
+    is_healthy = 'healthy' in item['condition'].lower()
+    return {
+        'date': item['date'],
+        'fruit': item['fruit'],
+        'condition': item['condition'],
+        'confidence': item['confidence'],
+        'health_status': 'Healthy' if is_healthy else 'Diseased',
+        'filename': item['filename']
+    }
+
+def stream_csv(items):
+    import csv
+    from io import StringIO
+    
+    # One small buffer reused for every row
+    output = StringIO()
+    writer = csv.writer(output)
+    
+    def flush():
+        chunk = output.getvalue()
+        output.seek(0)
+        output.truncate(0)
+        return chunk
+    
+    # Write headers
+    writer.writerow(['Date', 'Fruit', 'Condition', 'Confidence', 'Health Status', 'Filename'])
+    yield flush()
+    
+    # Write data
+    for item in items:
+        record = export_record(item)
+        writer.writerow([record['date'], record['fruit'], record['condition'], record['confidence'],
+                         record['health_status'], record['filename']])
+        yield flush()
+
+def stream_json(items):
+    yield '['
+    separator = ''
+    for item in items:
+        yield separator + json.dumps(export_record(item))
+        separator = ','
+    yield ']'
+
+def stream_ndjson(items):
+    for item in items:
+        yield json.dumps(export_record(item)) + '\n'
 
 @app.route('/api/export/<format>')
 def export_data(format):
-    """Export analysis history data"""
+    """Export analysis history data, streamed row by row"""
     try:
-        history_data = db.get_history()
-        
-        if format.lower() == 'csv':
-            import csv
-            from io import StringIO
-            
-            output = StringIO()
-            writer = csv.writer(output)
-            
-            # Write headers
-            writer.writerow(['Date', 'Fruit', 'Condition', 'Confidence', 'Health Status', 'Filename'])
-            
-            # Write data
-            for item in history_data:
-                is_healthy = 'healthy' in item['condition'].lower()
-                writer.writerow([
-                    item['date'],
-                    item['fruit'],
-                    item['condition'],
-                    item['confidence'],
-                    'Healthy' if is_healthy else 'Diseased',
-                    item['filename']
-                ])
-            
-            response = app.response_class(
-                output.getvalue(),
-                mimetype='text/csv',
-                headers={'Content-Disposition': 'attachment; filename=fruit_analysis_history.csv'}
-            )
-            return response
-            
-        elif format.lower() == 'json':
-            export_data = []
-            for item in history_data:
-                is_healthy = 'healthy' in item['condition'].lower()
-                export_data.append({
-                    'date': item['date'],
-                    'fruit': item['fruit'],
-                    'condition': item['condition'],
-                    'confidence': item['confidence'],
-                    'health_status': 'Healthy' if is_healthy else 'Diseased',
-                    'filename': item['filename']
-                })
-            
-            response = app.response_class(
-                jsonify(export_data).data,
-                mimetype='application/json',
-                headers={'Content-Disposition': 'attachment; filename=fruit_analysis_history.json'}
-            )
-            return response
-            
-        else:
+        format = format.lower()
+        if format not in EXPORT_FORMATS:
             return jsonify({'error': 'Unsupported format'}), 400
+        
+        try:
+            items = db.iter_history(**history_filters(request.args))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        streams = {'csv': stream_csv, 'json': stream_json, 'ndjson': stream_ndjson}
+        mimetype, download_name = EXPORT_FORMATS[format]
+        return app.response_class(
+            stream_with_context(streams[format](items)),
+            mimetype=mimetype,
+            headers={'Content-Disposition': f'attachment; filename={download_name}'}
+        )
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/corrections/stats')
+def correction_stats():
+    return jsonify(corrections.stats())
+
+@app.route('/api/corrections/manifest')
+def correction_manifest():
+    """Retraining manifest: one labeled sample per corrected image, streamed as NDJSON"""
+    try:
+        records = corrections.iter_manifest(db, image_dir=upload_writer.upload_dir)
+        return app.response_class(
+            stream_with_context(json.dumps(record) + '\n' for record in records),
+            mimetype='application/x-ndjson',
+            headers={'Content-Disposition': 'attachment; filename=retraining_manifest.ndjson'}
+        )
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/feedback/rate', methods=['POST'])
 def rate_prediction():
     try:
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Accuracy and latency trade-off of the two-stage cascade.
+
+Every image is scored once by the first-stage model and once by the full
+model with TTA, timing each. Cascade outcomes for a range of confidence
+thresholds are then derived from those measurements: accuracy, escalation
+rate and mean/p95 latency per image, next to the full-only and fast-only
+baselines.
+
+Labeled images come from a dataset directory with one folder per class
+(e.g. dataset/apple_scab/*.jpg). Without one, random-weight models and
+synthetic images show the latency side only.
+
+Run from the project root:
+    python -m benchmarks.cascade_benchmark --data dataset/
+    python -m benchmarks.cascade_benchmark --synthetic 50
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from advanced_predictor import AdvancedPredictor, INFERENCE_MODES
+from benchmarks.synthetic import write_synthetic_bundle
+
+
+def load_dataset(data_dir, limit_per_class):
+    samples = []
+    for class_name in sorted(os.listdir(data_dir)):
+        class_dir = os.path.join(data_dir, class_name)
+        if not os.path.isdir(class_dir):
+            continue
+        names = sorted(n for n in os.listdir(class_dir) if n.lower().endswith(('.jpg', '.jpeg', '.png')))
+        samples.extend((os.path.join(class_dir, name), class_name) for name in names[:limit_per_class])
+    return samples
+
+
+def score(predictor, fast, image, tta_mode):
+    """First-stage top-1 index, confidence and margin, the full result, and each stage's time in ms"""
+    start = time.perf_counter()
+    tensor = predictor.normalize_stack([predictor.load_image(image)])
+    preprocess_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    probs = fast.forward(tensor.to(fast.device)).softmax(dim=1)[0]
+    top = probs.topk(min(2, probs.shape[0]))
+    fast_ms = (time.perf_counter() - start) * 1000
+    margin = (top.values[0] - top.values[1]).item() if len(top.values) > 1 else top.values[0].item()
+
+    start = time.perf_counter()
+    full_result = predictor.predict_tensors(tensor, tta_mode)[0]
+    full_ms = (time.perf_counter() - start) * 1000
+
+    return {
+        'fast_idx': top.indices[0].item(),
+        'fast_confidence': top.values[0].item(),
+        'fast_margin': margin,
+        'full_label': (full_result['fruit'], full_result['disease']),
+        'preprocess_ms': preprocess_ms,
+        'fast_ms': fast_ms,
+        'full_ms': full_ms
+    }
+
+
+def report_row(name, correct, latencies, escalation_rate):
+    accuracy = f"{np.mean(correct):.1%}" if correct is not None else 'n/a'
+    print(f"{name:<18}{accuracy:>10}{escalation_rate:>12.1%}{np.mean(latencies):>11.1f}{np.percentile(latencies, 95):>11.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cascade accuracy/latency trade-off')
+    parser.add_argument('--data', default=None, help='labeled dataset directory, one folder per class')
+    parser.add_argument('--limit-per-class', type=int, default=50)
+    parser.add_argument('--synthetic', type=int, default=0, help='synthetic images with random-weight models')
+    parser.add_argument('--model-path', default='models/')
+    parser.add_argument('--fast-model-path', default='models/fast/')
+    parser.add_argument('--fast-model-name', default='efficientnet-b0')
+    parser.add_argument('--tta-mode', default='full')
+    parser.add_argument('--inference-mode', default='fp32', choices=INFERENCE_MODES)
+    parser.add_argument('--thresholds', default='0.5,0.6,0.7,0.8,0.85,0.9,0.95')
+    parser.add_argument('--margin', type=float, default=0.5, help='cascade top-1/top-2 margin')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.synthetic:
+            full_path = write_synthetic_bundle(os.path.join(tmp, 'full'), 'efficientnet-b2')
+            fast_path = write_synthetic_bundle(os.path.join(tmp, 'fast'), args.fast_model_name, seed=1)
+        else:
+            full_path, fast_path = args.model_path, args.fast_model_path
+        predictor = AdvancedPredictor(model_path=full_path, tta_mode=args.tta_mode, inference_mode=args.inference_mode)
+        fast = AdvancedPredictor(model_path=fast_path, tta_mode='none', inference_mode=args.inference_mode,
+                                 model_name=args.fast_model_name,
+                                 class_mapping_file=os.path.join(full_path, 'class_mapping.json'))
+    if predictor.model is None or fast.model is None:
+        print("Both the full and the first-stage model are needed (or use --synthetic).")
+        return
+    if fast.classes != predictor.classes:
+        print("The two models do not share a class mapping.")
+        return
+
+    if args.synthetic:
+        rng = np.random.default_rng(0)
+        samples = [(rng.integers(0, 255, (480, 640, 3), dtype=np.uint8), None) for _ in range(args.synthetic)]
+    else:
+        samples = load_dataset(args.data, args.limit_per_class) if args.data else []
+        if not samples:
+            print("No labeled images found; pass --data or --synthetic.")
+            return
+
+    # Warm both models up so the first image is not an outlier
+    for _ in range(2):
+        score(predictor, fast, np.zeros((224, 224, 3), dtype=np.uint8), args.tta_mode)
+
+    scores = []
+    for image, label in samples:
+        entry = score(predictor, fast, image, args.tta_mode)
+        entry['label'] = predictor.parse_class_name(label) if label else None
+        scores.append(entry)
+    labeled = scores[0]['label'] is not None
+
+    fast_labels = [predictor.parse_class_name(predictor.classes[s['fast_idx']]) for s in scores]
+
+    def correctness(predicted):
+        return [p == s['label'] for p, s in zip(predicted, scores)] if labeled else None
+
+    print(f"{len(scores)} images, full model {predictor.model_name} + {args.tta_mode} TTA, "
+          f"first stage {fast.model_name}, margin {args.margin}")
+    print(f"{'strategy':<18}{'accuracy':>10}{'escalated':>12}{'mean ms':>11}{'p95 ms':>11}")
+    report_row('full only', correctness([s['full_label'] for s in scores]),
+               [s['preprocess_ms'] + s['full_ms'] for s in scores], 1.0)
+    report_row('fast only', correctness(fast_labels),
+               [s['preprocess_ms'] + s['fast_ms'] for s in scores], 0.0)
+
+    for threshold in [float(t) for t in args.thresholds.split(',')]:
+        escalate = [s['fast_confidence'] < threshold or s['fast_margin'] < args.margin for s in scores]
+        predicted = [s['full_label'] if e else f for s, e, f in zip(scores, escalate, fast_labels)]
+        latencies = [s['preprocess_ms'] + s['fast_ms'] + (s['full_ms'] if e else 0) for s, e in zip(scores, escalate)]
+        report_row(f'cascade @ {threshold:.2f}', correctness(predicted), latencies, float(np.mean(escalate)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Measure AnalysisDatabase.add_analysis latency as the history grows, for the
+JSON and SQLite storage backends.
+
+Run from the project root: python -m benchmarks.database_benchmark
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+from database import AnalysisDatabase
+
+
+def insert_latency_ms(db, inserts):
+    timings = []
+    for i in range(inserts):
+        start = time.perf_counter()
+        db.add_analysis('Apple', 'healthy' if i % 3 else 'scab', '91.2%', f'bench-{i}.jpg')
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), max(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Analysis database insert benchmark')
+    parser.add_argument('--sizes', default='0,1000,10000,50000', help='history sizes to measure at')
+    parser.add_argument('--inserts', type=int, default=200, help='timed inserts per size')
+    parser.add_argument('--json-limit', type=int, default=10000, help='largest history tried with the JSON backend')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    print(f"{'backend':<8}{'history':>10}{'median ms':>12}{'max ms':>10}")
+
+    for backend in ('json', 'sqlite'):
+        with tempfile.TemporaryDirectory() as tmp:
+            db = AnalysisDatabase(os.path.join(tmp, 'analysis_data.json'), backend=backend)
+            history = 0
+            for size in sizes:
+                if backend == 'json' and size > args.json_limit:
+                    break
+                # Grow the history untimed, then time a run of inserts
+                while history < size:
+                    db.add_analysis('Tomato', 'early blight', '88.0%', f'fill-{history}.jpg')
+                    history += 1
+                median_ms, max_ms = insert_latency_ms(db, args.inserts)
+                history += args.inserts
+                print(f"{backend:<8}{size:>10}{median_ms:>12.3f}{max_ms:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
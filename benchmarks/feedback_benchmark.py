@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Measure FeedbackSystem throughput under concurrent posters (threads and
+processes) and check that no submission is lost.
+
+Run from the project root: python -m benchmarks.feedback_benchmark
+"""
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+
+from feedback_system import FeedbackSystem
+
+
+def post_ratings(feedback, count, offset):
+    for i in range(count):
+        feedback.add_rating(f'bench-{offset + i}', (i % 5) + 1, 'benchmark')
+
+
+def run_threads(feedback, workers, per_worker):
+    threads = [
+        threading.Thread(target=post_ratings, args=(feedback, per_worker, w * per_worker))
+        for w in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def process_worker(tmp, per_worker, offset):
+    feedback = FeedbackSystem(os.path.join(tmp, 'feedback_data.json'), os.path.join(tmp, 'feedback_data.jsonl'))
+    post_ratings(feedback, per_worker, offset)
+
+
+def run_processes(tmp, workers, per_worker):
+    processes = [
+        multiprocessing.Process(target=process_worker, args=(tmp, per_worker, w * per_worker))
+        for w in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Feedback system concurrency benchmark')
+    parser.add_argument('--workers', default='1,4,16', help='concurrent posters to measure with')
+    parser.add_argument('--posts', type=int, default=200, help='posts per worker')
+    args = parser.parse_args()
+
+    print(f"{'mode':<10}{'workers':>8}{'posts/s':>10}{'stats ms':>10}{'lost':>6}")
+
+    for mode in ('threads', 'processes'):
+        for workers in [int(w) for w in args.workers.split(',')]:
+            with tempfile.TemporaryDirectory() as tmp:
+                feedback = FeedbackSystem(os.path.join(tmp, 'feedback_data.json'), os.path.join(tmp, 'feedback_data.jsonl'))
+
+                start = time.perf_counter()
+                if mode == 'threads':
+                    run_threads(feedback, workers, args.posts)
+                else:
+                    run_processes(tmp, workers, args.posts)
+                elapsed = time.perf_counter() - start
+
+                feedback.get_stats()  # fold in the run, then time a steady-state call
+                stats_start = time.perf_counter()
+                stats = feedback.get_stats()
+                stats_ms = (time.perf_counter() - stats_start) * 1000
+
+                total = workers * args.posts
+                lost = total - stats['total_ratings']
+                print(f"{mode:<10}{workers:>8}{total / elapsed:>10.0f}{stats_ms:>10.3f}{lost:>6}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Check an inference backend against the fp32 eager model.
+
+Scores a sample of images with both predictors (no TTA) and reports top-1
+agreement, probability drift and per-image latency, so a deployment can
+decide whether e.g. int8 or bf16 is accurate enough for its throughput gain.
+
+Run from the project root:
+    python -m benchmarks.inference_parity --mode int8 --images web/static/uploads
+"""
+
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+import torch
+
+from advanced_predictor import AdvancedPredictor, INFERENCE_MODES
+
+
+def sample_images(image_dir, limit):
+    """Original uploads only - derivatives like *_blurred.jpg are skipped"""
+    paths = sorted(glob.glob(os.path.join(image_dir, '*.jpg')))
+    paths = [p for p in paths if '_' not in os.path.basename(p)]
+    return paths[:limit]
+
+
+def score(predictor, batches):
+    probs, elapsed = [], 0.0
+    for batch in batches:
+        start = time.perf_counter()
+        probs.append(torch.softmax(predictor.forward(batch.to(predictor.device)), dim=1).float().cpu())
+        elapsed += time.perf_counter() - start
+    return torch.cat(probs), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Inference backend parity check')
+    parser.add_argument('--mode', required=True, choices=INFERENCE_MODES)
+    parser.add_argument('--model-path', default='models/')
+    parser.add_argument('--images', default='web/static/uploads', help='directory of sample images')
+    parser.add_argument('--limit', type=int, default=64)
+    parser.add_argument('--batch-size', type=int, default=8)
+    args = parser.parse_args()
+
+    reference = AdvancedPredictor(model_path=args.model_path, inference_mode='fp32')
+    candidate = AdvancedPredictor(model_path=args.model_path, inference_mode=args.mode)
+    if reference.model is None:
+        print("No trained model available - nothing to compare.")
+        return
+
+    paths = sample_images(args.images, args.limit)
+    if paths:
+        tensors = [reference.preprocess_image(p) for p in paths]
+    else:
+        print(f"No images in {args.images}, using random inputs")
+        tensors = [reference.preprocess_image(np.random.randint(0, 255, (224, 224, 3), dtype=np.uint8))
+                   for _ in range(args.limit)]
+    batches = [torch.cat(tensors[i:i + args.batch_size]) for i in range(0, len(tensors), args.batch_size)]
+
+    ref_probs, ref_time = score(reference, batches)
+    cand_probs, cand_time = score(candidate, batches)
+
+    drift = (ref_probs - cand_probs).abs()
+    agreement = (ref_probs.argmax(dim=1) == cand_probs.argmax(dim=1)).float().mean().item()
+
+    print("=" * 50)
+    print(f"PARITY: {args.mode} vs fp32 on {len(tensors)} images")
+    print("=" * 50)
+    print(f"Top-1 agreement:      {agreement * 100:.2f}%")
+    print(f"Max probability drift:  {drift.max().item():.4f}")
+    print(f"Mean probability drift: {drift.mean().item():.6f}")
+    print(f"fp32 latency:  {ref_time / len(tensors) * 1000:.1f} ms/image")
+    print(f"{args.mode} latency: {cand_time / len(tensors) * 1000:.1f} ms/image")
+    print(f"Speedup: {ref_time / cand_time:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
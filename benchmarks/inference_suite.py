@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Inference benchmark suite for AdvancedPredictor.
+
+Measures preprocessing, single-image latency percentiles per TTA mode,
+batched throughput per batch size and torch thread count, and peak RSS.
+Uses a random-weight model unless --model-path is given, so it runs
+offline. Results are written as JSON; --baseline compares against a saved
+run and exits non-zero on regressions.
+
+Run from the project root:
+    python -m benchmarks.inference_suite --output baseline.json
+    python -m benchmarks.inference_suite --baseline baseline.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+import torch
+
+from advanced_predictor import AdvancedPredictor, INFERENCE_MODES, TTA_MODES
+from benchmarks.synthetic import write_synthetic_bundle
+
+# Metrics where a larger value is better; every other metric is a time or a size
+HIGHER_IS_BETTER = ('images_per_s',)
+
+
+def percentiles(timings):
+    return {
+        'p50_ms': float(np.percentile(timings, 50)),
+        'p95_ms': float(np.percentile(timings, 95)),
+        'p99_ms': float(np.percentile(timings, 99))
+    }
+
+
+def time_runs(fn, runs, warmup=3):
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_suite(predictor, args):
+    results = {}
+    rng = np.random.default_rng(0)
+    camera_frame = rng.integers(0, 255, (480, 640, 3), dtype=np.uint8)
+
+    # Decode-free preprocessing of a camera-sized frame: resize, normalize, layout
+    timings = time_runs(
+        lambda: predictor.normalize_stack([predictor.load_image(camera_frame)], out=predictor.input_buffer(1)),
+        args.runs * 5
+    )
+    for name, value in percentiles(timings).items():
+        results[f'preprocess.{name}'] = value
+
+    batch_sizes = [int(size) for size in args.batch_sizes.split(',')]
+    tta_modes = args.tta_modes.split(',')
+
+    for threads in [int(t) for t in args.threads.split(',')]:
+        torch.set_num_threads(threads)
+
+        for tta_mode in tta_modes:
+            timings = time_runs(lambda: predictor.predict_single(camera_frame, tta_mode), args.runs)
+            for name, value in percentiles(timings).items():
+                results[f'latency.{tta_mode}.threads={threads}.{name}'] = value
+
+        for batch_size in batch_sizes:
+            images = rng.integers(0, 255, (batch_size, 224, 224, 3), dtype=np.uint8)
+            batch = predictor.normalize_stack(images)
+            timings = time_runs(lambda: predictor.predict_tensors(batch, 'none'), max(args.runs // batch_size, 3))
+            results[f'throughput.batch={batch_size}.threads={threads}.images_per_s'] = \
+                batch_size * 1000 / float(np.median(timings))
+
+        print(f"  threads={threads} done", file=sys.stderr)
+
+    results['peak_rss_mb'] = peak_rss_mb()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Print metric changes against the baseline and return the regressed metric names"""
+    regressions = []
+    print(f"{'metric':<48}{'baseline':>12}{'current':>12}{'change':>9}")
+    for name, value in results.items():
+        if name not in baseline or not baseline[name]:
+            continue
+        change = (value - baseline[name]) / baseline[name]
+        worse = -change if name.endswith(HIGHER_IS_BETTER) else change
+        flag = ''
+        if worse > tolerance:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:<48}{baseline[name]:>12.2f}{value:>12.2f}{change:>+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='AdvancedPredictor inference benchmark suite')
+    parser.add_argument('--model-path', default=None, help='trained model directory (default: random weights)')
+    parser.add_argument('--model-name', default='efficientnet-b2', help='architecture of the random-weight model')
+    parser.add_argument('--inference-mode', default='fp32', choices=INFERENCE_MODES)
+    parser.add_argument('--tta-modes', default=','.join(list(TTA_MODES) + ['adaptive']))
+    parser.add_argument('--batch-sizes', default='1,4,8,16')
+    parser.add_argument('--threads', default=f"1,{os.cpu_count() or 1}", help='torch intra-op thread counts')
+    parser.add_argument('--runs', type=int, default=30, help='timed runs per latency measurement')
+    parser.add_argument('--output', default=None, help='write results JSON here')
+    parser.add_argument('--baseline', default=None, help='compare against this results JSON')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='relative change counted as a regression')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = args.model_path or write_synthetic_bundle(tmp, args.model_name)
+        predictor = AdvancedPredictor(model_path=model_path, inference_mode=args.inference_mode)
+    if predictor.model is None:
+        sys.exit("Model failed to load - nothing to benchmark.")
+
+    report = {
+        'meta': {
+            'model': args.model_path or f'random {predictor.model_name}',
+            'inference_mode': args.inference_mode,
+            'torch': torch.__version__,
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')
+        },
+        'results': run_suite(predictor, args)
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)['results']
+        regressions = compare(report['results'], baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}")
+            sys.exit(1)
+        print("\nNo regressions")
+    elif not args.output:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
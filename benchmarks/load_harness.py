@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Load-test the web app by replaying images against /predict, /batch_predict
+and /live_detect.
+
+Images come from web/static/uploads (originals only) or are synthetic.
+Requests go in-process through the Flask test client, or over HTTP to a
+running server with --url. Each concurrency level is run in turn and
+reported with throughput, latency percentiles, error rate, cache hit
+rate and how p95 latency grows relative to the first level.
+
+The corpus is replayed at every level, so by default the in-process app
+runs with the prediction cache and live-frame reuse turned off and the
+curve measures inference; --cache turns both back on. Against --url the
+server's own settings apply, and the hit rate columns show their effect.
+
+Run from the project root:
+    python -m benchmarks.load_harness --endpoint predict --concurrency 1,2,4,8
+    python -m benchmarks.load_harness --url http://127.0.0.1:5000 --rate 20
+    python -m benchmarks.load_harness --endpoint live --cache
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+ENDPOINTS = {'predict': '/predict', 'batch': '/batch_predict', 'live': '/live_detect'}
+DERIVATIVE_SUFFIXES = ('_preprocessed', '_rotated', '_blurred', '_cropped', '_edges')
+
+
+def load_corpus(upload_dir, limit):
+    """Raw bytes of uploaded originals, skipping the processed views stored beside them"""
+    names = sorted(
+        name for name in os.listdir(upload_dir)
+        if name.lower().endswith(('.jpg', '.jpeg', '.png'))
+        and not os.path.splitext(name)[0].endswith(DERIVATIVE_SUFFIXES)
+    ) if os.path.isdir(upload_dir) else []
+    corpus = []
+    for name in names[:limit]:
+        with open(os.path.join(upload_dir, name), 'rb') as f:
+            corpus.append(f.read())
+    return corpus
+
+
+def synthetic_corpus(count, seed=0):
+    """JPEG-encoded camera-sized images with a coloured blob on a noisy background"""
+    rng = np.random.default_rng(seed)
+    corpus = []
+    for _ in range(count):
+        image = rng.integers(0, 80, (480, 640, 3), dtype=np.uint8)
+        center = (int(rng.integers(160, 480)), int(rng.integers(120, 360)))
+        color = tuple(int(c) for c in rng.integers(60, 255, 3))
+        cv2.circle(image, center, int(rng.integers(60, 140)), color, -1)
+        corpus.append(cv2.imencode('.jpg', image)[1].tobytes())
+    return corpus
+
+
+def encode_multipart(fields, files):
+    """multipart/form-data body for urllib; files is a list of (field, filename, bytes)"""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, filename, data in files:
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     f'Content-Type: image/jpeg\r\n\r\n'.encode() + data + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+class HTTPClient:
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def get_json(self, path):
+        with urllib.request.urlopen(self.base_url + path, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def post(self, path, fields, files):
+        body, content_type = encode_multipart(fields, files)
+        request = urllib.request.Request(self.base_url + path, data=body, headers={'Content-Type': content_type})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status, response.headers.get('Content-Type', ''), response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers.get('Content-Type', ''), e.read()
+
+
+class InProcessClient:
+    """Flask test client; one per thread, since clients keep per-request state"""
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def _client(self):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        return client
+
+    def get_json(self, path):
+        return self._client().get(path).get_json()
+
+    def post(self, path, fields, files):
+        from io import BytesIO
+
+        client = self._client()
+        data = dict(fields)
+        for name, filename, payload in files:
+            data.setdefault(name, []).append((BytesIO(payload), filename))
+        response = client.post(path, data=data, content_type='multipart/form-data')
+        return response.status_code, response.content_type or '', response.get_data()
+
+
+def in_process_app(scratch_dir, cache=False):
+    """Import the app with its history, journals, uploads and processed-image cache in a scratch directory.
+
+    Unless cache is set, the prediction cache and live-frame reuse are off: the
+    corpus repeats, and every repeat would otherwise skip the model.
+    """
+    os.environ.setdefault('DATABASE_FILE', os.path.join(scratch_dir, 'analysis_data.json'))
+    os.environ.setdefault('DERIVATIVE_CACHE_DIR', os.path.join(scratch_dir, 'derivatives'))
+    os.environ.setdefault('FEEDBACK_JOURNAL', os.path.join(scratch_dir, 'feedback_data.jsonl'))
+    os.environ.setdefault('CORRECTIONS_JOURNAL', os.path.join(scratch_dir, 'corrections.jsonl'))
+    # Keep replayed uploads out of the real uploads directory
+    os.environ.setdefault('UPLOAD_DIR', os.path.join(scratch_dir, 'uploads'))
+    if not cache:
+        os.environ['PREDICTION_CACHE'] = '0'
+        # No two frame hashes are ever within -1 bits, so every live frame is analyzed
+        os.environ['LIVE_CHANGE_THRESHOLD'] = '-1'
+    import app as app_module
+    return app_module.app
+
+
+def reuse_counters(client):
+    """Prediction cache hits and lookups, and live frames answered without the model, so far"""
+    try:
+        stats = client.get_json('/api/inference/stats')
+    except Exception:
+        return None
+    cache = stats.get('cache') or {}
+    live = stats.get('live_sessions') or {}
+    return {
+        'cache_hits': cache.get('hits', 0),
+        'cache_lookups': cache.get('hits', 0) + cache.get('misses', 0),
+        'live_reused': live.get('reuse', 0),
+        'live_frames': live.get('full', 0) + live.get('refresh', 0) + live.get('reuse', 0)
+    }
+
+
+def reuse_rates(before, after):
+    """Cache hit rate and live reuse rate between two reuse_counters() readings (None when unknown)"""
+    if before is None or after is None:
+        return None, None
+    delta = {key: after[key] - before[key] for key in after}
+    cache_rate = delta['cache_hits'] / delta['cache_lookups'] if delta['cache_lookups'] else 0.0
+    live_rate = delta['live_reused'] / delta['live_frames'] if delta['live_frames'] else 0.0
+    return cache_rate, live_rate
+
+
+def is_error(status, content_type, body):
+    if status >= 400:
+        return True
+    if 'json' in content_type:
+        try:
+            return json.loads(body).get('success') is False
+        except ValueError:
+            return True
+    return False
+
+
+def run_level(client, endpoint, corpus, concurrency, requests, rate, batch_files):
+    """Send requests at one concurrency level; returns latencies (ms) and the error count"""
+    images = itertools.cycle(random.Random(concurrency).sample(corpus, len(corpus)))
+    lock = threading.Lock()
+    latencies, errors = [], [0]
+
+    def next_files():
+        with lock:
+            count = batch_files if endpoint == 'batch' else 1
+            return [('files' if endpoint == 'batch' else 'file', f'load-{i}.jpg', next(images)) for i in range(count)]
+
+    def send(scheduled_at, session):
+        files = next_files()
+        fields = {'session_id': session} if endpoint == 'live' else {}
+        try:
+            status, content_type, body = client.post(ENDPOINTS[endpoint], fields, files)
+            failed = is_error(status, content_type, body)
+        except Exception:
+            failed = True
+        # Open-loop latency counts from the scheduled arrival, so queueing shows up
+        elapsed = (time.perf_counter() - scheduled_at) * 1000
+        with lock:
+            latencies.append(elapsed)
+            errors[0] += failed
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        if rate:
+            # Open loop: Poisson arrivals at the given rate, at most `concurrency` in flight
+            arrival = start
+            arrivals = random.Random(0)
+            futures = []
+            for i in range(requests):
+                arrival += arrivals.expovariate(rate)
+                time.sleep(max(0.0, arrival - time.perf_counter()))
+                futures.append(pool.submit(send, arrival, f'load-session-{i % concurrency}'))
+            for future in futures:
+                future.result()
+        else:
+            # Closed loop: each worker sends its next request as soon as the last one returns
+            def worker(index, count):
+                for _ in range(count):
+                    send(time.perf_counter(), f'load-session-{index}')
+
+            shares = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+            for future in [pool.submit(worker, i, n) for i, n in enumerate(shares)]:
+                future.result()
+    return latencies, errors[0], time.perf_counter() - start
+
+
+def summarize(concurrency, latencies, errors, elapsed, images_per_request):
+    return {
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'throughput_rps': len(latencies) / elapsed,
+        'images_per_s': len(latencies) * images_per_request / elapsed,
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'error_rate': errors / len(latencies)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay images against the web app under load')
+    parser.add_argument('--endpoint', default='predict', choices=ENDPOINTS)
+    parser.add_argument('--url', default=None, help='base URL of a running server (default: in-process test client)')
+    parser.add_argument('--concurrency', default='1,2,4,8', help='concurrency levels to run in turn')
+    parser.add_argument('--requests', type=int, default=100, help='requests per concurrency level')
+    parser.add_argument('--rate', type=float, default=None, help='open-loop arrival rate in requests/s')
+    parser.add_argument('--batch-files', type=int, default=8, help='images per /batch_predict request')
+    parser.add_argument('--corpus', default='web/static/uploads')
+    parser.add_argument('--corpus-limit', type=int, default=500)
+    parser.add_argument('--synthetic', type=int, default=0, help='use this many synthetic images instead of the corpus')
+    parser.add_argument('--warmup', type=int, default=5, help='untimed requests before the first level')
+    parser.add_argument('--timeout', type=float, default=60.0, help='HTTP request timeout in seconds')
+    parser.add_argument('--cache', action='store_true',
+                        help='keep the prediction cache and live-frame reuse on (in-process only)')
+    parser.add_argument('--output', default=None, help='write the report as JSON')
+    args = parser.parse_args()
+
+    corpus = synthetic_corpus(args.synthetic) if args.synthetic else load_corpus(args.corpus, args.corpus_limit)
+    if not corpus:
+        print(f"No images in {args.corpus}; falling back to synthetic images")
+        corpus = synthetic_corpus(50)
+
+    with tempfile.TemporaryDirectory() as scratch:
+        client = HTTPClient(args.url, args.timeout) if args.url else InProcessClient(in_process_app(scratch, args.cache))
+        images_per_request = args.batch_files if args.endpoint == 'batch' else 1
+
+        if args.warmup:
+            run_level(client, args.endpoint, corpus, 1, args.warmup, None, args.batch_files)
+
+        levels = []
+        print(f"{'conc':>5}{'req/s':>9}{'img/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}"
+              f"{'cache':>8}{'reuse':>8}{'p95 x':>8}")
+        for concurrency in [int(c) for c in args.concurrency.split(',')]:
+            before = reuse_counters(client)
+            latencies, errors, elapsed = run_level(client, args.endpoint, corpus, concurrency,
+                                                   args.requests, args.rate, args.batch_files)
+            level = summarize(concurrency, latencies, errors, elapsed, images_per_request)
+            # Results served without the model; a high rate means the level did not measure inference
+            level['cache_hit_rate'], level['live_reuse_rate'] = reuse_rates(before, reuse_counters(client))
+            # Degradation: p95 relative to the first (lowest) concurrency level
+            level['p95_vs_first'] = level['p95_ms'] / levels[0]['p95_ms'] if levels else 1.0
+            levels.append(level)
+            cache_rate = f"{level['cache_hit_rate']:.1%}" if level['cache_hit_rate'] is not None else 'n/a'
+            live_rate = f"{level['live_reuse_rate']:.1%}" if level['live_reuse_rate'] is not None else 'n/a'
+            print(f"{concurrency:>5}{level['throughput_rps']:>9.1f}{level['images_per_s']:>9.1f}"
+                  f"{level['p50_ms']:>10.1f}{level['p95_ms']:>10.1f}{level['p99_ms']:>10.1f}"
+                  f"{level['error_rate']:>8.1%}{cache_rate:>8}{live_rate:>8}{level['p95_vs_first']:>7.2f}x")
+
+    if args.output:
+        report = {
+            'endpoint': ENDPOINTS[args.endpoint],
+            'target': args.url or 'in-process',
+            'rate': args.rate,
+            'cache': args.cache if not args.url else 'server settings',
+            'corpus_images': len(corpus),
+            'levels': levels
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
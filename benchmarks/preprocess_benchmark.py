@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Compare the fused NumPy/OpenCV preprocessing with the previous torchvision
+pipeline (ToPILImage -> Resize -> ToTensor -> Normalize).
+
+Run from the project root: python -m benchmarks.preprocess_benchmark
+"""
+
+import argparse
+import time
+
+import cv2
+import numpy as np
+import torch
+import torchvision.transforms as transforms
+
+from advanced_predictor import AdvancedPredictor
+
+LEGACY_TRANSFORM = transforms.Compose([
+    transforms.ToPILImage(),
+    transforms.Resize((224, 224)),
+    transforms.ToTensor(),
+    transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
+])
+
+
+def legacy_preprocess(image):
+    """The pre-fusion preprocess_image for numpy input"""
+    return LEGACY_TRANSFORM(cv2.cvtColor(image, cv2.COLOR_BGR2RGB)).unsqueeze(0)
+
+
+def time_per_image_ms(fn, images, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn(images)
+        timings.append((time.perf_counter() - start) * 1000 / len(images))
+    return float(np.median(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Preprocessing benchmark')
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--width', type=int, default=1440)
+    parser.add_argument('--images', type=int, default=16)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    predictor = AdvancedPredictor()
+    images = [np.random.randint(0, 255, (args.height, args.width, 3), dtype=np.uint8) for _ in range(args.images)]
+
+    def legacy(batch):
+        return torch.cat([legacy_preprocess(image) for image in batch])
+
+    def fused(batch):
+        resized = [predictor.load_image(image) for image in batch]
+        return predictor.normalize_stack(resized, out=predictor.input_buffer(len(resized)))
+
+    drift = (legacy(images) - fused(images)).abs()
+    legacy_ms = time_per_image_ms(legacy, images, args.runs)
+    fused_ms = time_per_image_ms(fused, images, args.runs)
+
+    print("=" * 50)
+    print(f"PREPROCESSING {args.width}x{args.height} -> 224x224, {args.images} images")
+    print("=" * 50)
+    print(f"torchvision pipeline: {legacy_ms:.2f} ms/image")
+    print(f"fused pipeline:       {fused_ms:.2f} ms/image")
+    print(f"Speedup: {legacy_ms / fused_ms:.2f}x")
+    print(f"Max abs difference:  {drift.max().item():.4f}")
+    print(f"Mean abs difference: {drift.mean().item():.5f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Break down predictor start-up time: imports, model file read, architecture
+construction, weight load, inference-mode setup and the first inferences.
+
+Run from the project root in a fresh process: python -m benchmarks.startup_benchmark
+"""
+
+import argparse
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Predictor start-up benchmark')
+    parser.add_argument('--model-path', default='models/')
+    parser.add_argument('--inference-mode', default='fp32')
+    args = parser.parse_args()
+
+    timings = {}
+
+    start = time.perf_counter()
+    import numpy as np
+    import torch
+    from advanced_predictor import AdvancedPredictor
+    timings['import_ms'] = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    predictor = AdvancedPredictor(model_path=args.model_path, inference_mode=args.inference_mode)
+    timings['predictor_init_ms'] = (time.perf_counter() - start) * 1000
+    timings.update(predictor.startup_timings)
+
+    if predictor.model is not None:
+        image = np.random.randint(0, 255, (224, 224, 3), dtype=np.uint8)
+        for label in ('first_inference_ms', 'second_inference_ms'):
+            start = time.perf_counter()
+            predictor.predict_single(image, 'none')
+            timings[label] = (time.perf_counter() - start) * 1000
+
+    print("=" * 50)
+    print(f"STARTUP TIMINGS (torch {torch.__version__}, {args.inference_mode})")
+    print("=" * 50)
+    for label, value in timings.items():
+        print(f"{label:<22}{value:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+"""
+Random-weight model bundles, so benchmarks run offline without a trained
+checkpoint. The bundle goes through the same loading path as a real one.
+"""
+
+import os
+
+import torch
+
+from advanced_predictor import AdvancedFruitDiseaseModel, BUNDLE_FILENAME
+
+SYNTHETIC_CLASSES = [
+    'apple_healthy', 'apple_scab', 'apple_black_rot', 'banana_healthy', 'banana_rotten',
+    'bellpepper_healthy', 'bellpepper_bacterial_spot', 'cucumber_healthy', 'cucumber_fungal_infection',
+    'grape_healthy', 'grape_black_rot', 'mango_healthy', 'mango_anthracnose', 'orange_healthy',
+    'orange_citrus_canker', 'potato_healthy', 'potato_early_blight', 'tomato_healthy',
+    'tomato_early_blight', 'tomato_late_blight'
+]
+
+
+def write_synthetic_bundle(output_dir, model_name='efficientnet-b2', classes=None, seed=0):
+    """Save a randomly initialised model as output_dir/model_bundle.pt and return output_dir"""
+    classes = classes or SYNTHETIC_CLASSES
+    torch.manual_seed(seed)
+    model = AdvancedFruitDiseaseModel(len(classes), model_name, pretrained=False)
+
+    os.makedirs(output_dir, exist_ok=True)
+    torch.save({
+        'format_version': 1,
+        'model_name': model_name,
+        'num_classes': len(classes),
+        'classes': classes,
+        'class_to_idx': {name: idx for idx, name in enumerate(classes)},
+        'model_state_dict': model.state_dict()
+    }, os.path.join(output_dir, BUNDLE_FILENAME))
+    return output_dir
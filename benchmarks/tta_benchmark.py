@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Compare sequential TTA (one forward per view) with the batched TTA forward
+used by AdvancedPredictor.predict_single.
+
+Run from the project root: python -m benchmarks.tta_benchmark
+"""
+
+import argparse
+import time
+
+import numpy as np
+import torch
+
+from advanced_predictor import AdvancedPredictor, INFERENCE_MODES, TTA_MODES
+
+
+def sequential_tta(predictor, tensor_image, tta_mode):
+    """Reference implementation: one batch-of-one forward per view"""
+    predictions = []
+    predictions.append(torch.softmax(predictor.forward(tensor_image), dim=1))
+    for tta_transform in TTA_MODES[tta_mode]:
+        predictions.append(torch.softmax(predictor.forward(tta_transform(tensor_image)), dim=1))
+    return torch.mean(torch.stack(predictions), dim=0)
+
+
+def batched_tta(predictor, tensor_image, tta_mode):
+    """Batched implementation: all views in a single forward"""
+    outputs = predictor.forward(predictor.build_tta_batch(tensor_image, tta_mode))
+    return torch.softmax(outputs, dim=1).mean(dim=0, keepdim=True)
+
+
+def time_ms(fn, runs, warmup=2):
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='TTA latency benchmark')
+    parser.add_argument('--model-path', default='models/')
+    parser.add_argument('--inference-mode', default='fp32', choices=INFERENCE_MODES)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--threads', type=int, default=None, help='torch intra-op threads')
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    predictor = AdvancedPredictor(model_path=args.model_path, inference_mode=args.inference_mode)
+    if predictor.model is None:
+        print("No trained model available - nothing to benchmark.")
+        return
+
+    image = np.random.randint(0, 255, (224, 224, 3), dtype=np.uint8)
+    tensor_image = predictor.preprocess_image(image).to(predictor.device)
+
+    print(f"{'mode':<8}{'views':>6}{'sequential ms':>16}{'batched ms':>14}{'speedup':>10}{'max |dp|':>12}")
+    for tta_mode in TTA_MODES:
+        views = len(TTA_MODES[tta_mode]) + 1
+        drift = (sequential_tta(predictor, tensor_image, tta_mode) -
+                 batched_tta(predictor, tensor_image, tta_mode)).abs().max().item()
+        seq_ms = time_ms(lambda: sequential_tta(predictor, tensor_image, tta_mode), args.runs)
+        bat_ms = time_ms(lambda: batched_tta(predictor, tensor_image, tta_mode), args.runs)
+        print(f"{tta_mode:<8}{views:>6}{seq_ms:>16.1f}{bat_ms:>14.1f}{seq_ms / bat_ms:>9.2f}x{drift:>12.2e}")
+
+    # Adaptive TTA: the number of views depends on how confident the first pass is
+    passes = predictor.predict_tensors(tensor_image, 'adaptive')[0]['tta_passes']
+    adaptive_ms = time_ms(lambda: predictor.predict_tensors(tensor_image, 'adaptive'), args.runs)
+    print(f"{'adaptive':<8}{passes:>6}{'-':>16}{adaptive_ms:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
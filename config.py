@@ -0,0 +1,101 @@
+"""
+Runtime settings for the web application.
+Every value can be overridden with an environment variable of the same name.
+"""
+
+import os
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+def _env_float(name, default):
+    return float(os.environ.get(name, default))
+
+def _env_bool(name, default):
+    return os.environ.get(name, str(default)).lower() in ('1', 'true', 'yes', 'on')
+
+# Images per forward pass for /batch_predict
+BATCH_SIZE = _env_int('BATCH_SIZE', 16)
+
+# Micro-batching of concurrent request threads into shared forward passes (opt-in: a lone
+# request can wait up to MICRO_BATCH_MAX_WAIT_MS for company). /batch_predict never uses it.
+MICRO_BATCHING = _env_bool('MICRO_BATCHING', False)
+MICRO_BATCH_MAX_SIZE = _env_int('MICRO_BATCH_MAX_SIZE', 8)
+MICRO_BATCH_MAX_WAIT_MS = _env_float('MICRO_BATCH_MAX_WAIT_MS', 5.0)
+
+# Out-of-process inference: worker processes fed through shared memory (0 = in-process).
+# Takes the place of micro-batching; each worker batches whatever is queued for it.
+INFERENCE_WORKERS = _env_int('INFERENCE_WORKERS', 0)
+INFERENCE_TIMEOUT = _env_float('INFERENCE_TIMEOUT', 30.0)
+# Seconds a worker may take to load its model before it is restarted and its queued requests fail
+INFERENCE_STARTUP_TIMEOUT = _env_float('INFERENCE_STARTUP_TIMEOUT', 300.0)
+
+# Test Time Augmentation: 'none', 'flips', 'full' or 'adaptive'
+TTA_MODE = os.environ.get('TTA_MODE', 'full')
+# Adaptive TTA skips augmented views once top-1 and top-1/top-2 margin clear these
+EARLY_EXIT_CONFIDENCE = _env_float('EARLY_EXIT_CONFIDENCE', 0.9)
+EARLY_EXIT_MARGIN = _env_float('EARLY_EXIT_MARGIN', 0.5)
+
+# Content-addressed prediction cache; set PREDICTION_CACHE_DIR to keep results across restarts
+PREDICTION_CACHE = _env_bool('PREDICTION_CACHE', True)
+PREDICTION_CACHE_SIZE = _env_int('PREDICTION_CACHE_SIZE', 1024)
+PREDICTION_CACHE_DIR = os.environ.get('PREDICTION_CACHE_DIR', '')
+PREDICTION_CACHE_DISK_MB = _env_float('PREDICTION_CACHE_DISK_MB', 256)
+
+# /live_detect temporal reuse: frames within LIVE_CHANGE_THRESHOLD hash bits reuse the last result
+LIVE_CHANGE_THRESHOLD = _env_int('LIVE_CHANGE_THRESHOLD', 6)
+LIVE_REFRESH_EVERY = _env_int('LIVE_REFRESH_EVERY', 5)
+LIVE_SESSION_TTL = _env_int('LIVE_SESSION_TTL', 300)
+# Bounds of the adaptive interval live clients wait between frames
+LIVE_MIN_FRAME_MS = _env_int('LIVE_MIN_FRAME_MS', 150)
+LIVE_MAX_FRAME_MS = _env_int('LIVE_MAX_FRAME_MS', 2000)
+
+# Model directory; POST /api/model/reload loads it (or a subdirectory) without a restart
+MODEL_PATH = os.environ.get('MODEL_PATH', 'models/')
+# Seconds between checks for a changed checkpoint in MODEL_PATH (0 = only reload on request)
+MODEL_WATCH_INTERVAL = _env_float('MODEL_WATCH_INTERVAL', 0)
+# Warm-up inferences per TTA mode before a new model takes traffic
+MODEL_WARMUP_RUNS = _env_int('MODEL_WARMUP_RUNS', 3)
+# With INFERENCE_WORKERS, each loaded checkpoint is copied here so workers (and rollbacks)
+# run exactly the weights that were loaded; empty = a directory in the system temp dir
+MODEL_SNAPSHOT_DIR = os.environ.get('MODEL_SNAPSHOT_DIR', '')
+
+# Two-stage cascade: a small first-stage model answers confident images, the rest escalate
+# to the full model with TTA. The first stage shares MODEL_PATH's class_mapping.json.
+CASCADE = _env_bool('CASCADE', False)
+CASCADE_MODEL_PATH = os.environ.get('CASCADE_MODEL_PATH', 'models/fast/')
+CASCADE_MODEL_NAME = os.environ.get('CASCADE_MODEL_NAME', 'efficientnet-b0')
+CASCADE_CONFIDENCE = _env_float('CASCADE_CONFIDENCE', 0.85)
+CASCADE_MARGIN = _env_float('CASCADE_MARGIN', 0.5)
+
+# CPU inference backend: 'fp32', 'bf16', 'int8', 'channels_last' or 'compiled'
+INFERENCE_MODE = os.environ.get('INFERENCE_MODE', 'fp32')
+
+# Processed views for the result page, rendered on first request and cached on disk
+DERIVATIVE_CACHE_DIR = os.environ.get('DERIVATIVE_CACHE_DIR', 'web/static/derivatives')
+DERIVATIVE_CACHE_MB = _env_float('DERIVATIVE_CACHE_MB', 512)
+# Background threads pre-generating views of new uploads (0 = purely on demand)
+DERIVATIVE_WORKERS = _env_int('DERIVATIVE_WORKERS', 0)
+
+# Stage timing histograms and counters served at /metrics; SERVER_TIMING adds per-request headers
+METRICS = _env_bool('METRICS', True)
+SERVER_TIMING = _env_bool('SERVER_TIMING', False)
+
+# Analysis history storage: 'sqlite' (indexed, WAL) or 'json' (legacy single file)
+DATABASE_BACKEND = os.environ.get('DATABASE_BACKEND', 'sqlite')
+DATABASE_FILE = os.environ.get('DATABASE_FILE', 'analysis_data.json')
+# Append-only journals of user feedback and prediction corrections
+FEEDBACK_JOURNAL = os.environ.get('FEEDBACK_JOURNAL', 'feedback_data.jsonl')
+CORRECTIONS_JOURNAL = os.environ.get('CORRECTIONS_JOURNAL', 'corrections.jsonl')
+# Uploaded originals, served at /static/uploads/<filename>
+UPLOAD_DIR = os.environ.get('UPLOAD_DIR', 'web/static/uploads')
+
+# Prefork server (serve.py): worker processes forked from a master holding the preloaded model
+SERVER_HOST = os.environ.get('SERVER_HOST', '0.0.0.0')
+SERVER_PORT = _env_int('SERVER_PORT', 5000)
+# 0 = one worker per CPU core
+SERVER_WORKERS = _env_int('SERVER_WORKERS', 0)
+# Request threads inside each worker
+SERVER_THREADED = _env_bool('SERVER_THREADED', True)
+# torch intra-op threads per worker; 0 = cores divided evenly between workers
+TORCH_THREADS = _env_int('TORCH_THREADS', 0)
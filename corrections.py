@@ -0,0 +1,105 @@
+import json
+import os
+import threading
+from datetime import datetime
+
+from journal import JsonlJournal
+
+class CorrectionStore:
+    """User corrections as an append-only journal, indexed by upload filename.
+    
+    The latest correction for an image wins, so the index doubles as the
+    deduplicated set of labeled samples for retraining.
+    """
+    
+    def __init__(self, journal_file='corrections.jsonl', legacy_file='corrections.json'):
+        self.legacy_file = legacy_file
+        self.journal = JsonlJournal(journal_file)
+        
+        self._lock = threading.Lock()
+        self._offset = 0
+        self._total = 0
+        self._by_filename = {}
+        
+        if not self.journal.exists():
+            self.journal.compact(self._legacy_records())
+        self._catch_up()
+    
+    def _legacy_records(self):
+        if not os.path.exists(self.legacy_file):
+            return []
+        try:
+            with open(self.legacy_file, 'r') as f:
+                data = json.load(f)
+        except ValueError:
+            return []
+        return [entry for entry in data if isinstance(entry, dict)] if isinstance(data, list) else []
+    
+    def add(self, filename, correct_fruit, correct_condition, original_prediction='unknown'):
+        correction = {
+            'filename': filename,
+            'original_prediction': original_prediction,
+            'correct_fruit': correct_fruit,
+            'correct_condition': correct_condition,
+            'timestamp': str(datetime.now())
+        }
+        self.journal.append(correction)
+        return correction
+    
+    def get(self, filename):
+        """Latest correction for an upload filename, or None"""
+        self._catch_up()
+        with self._lock:
+            return self._by_filename.get(filename)
+    
+    def latest(self):
+        """Latest correction per image, in the order those corrections were made"""
+        self._catch_up()
+        with self._lock:
+            return list(self._by_filename.values())
+    
+    def stats(self):
+        self._catch_up()
+        with self._lock:
+            return {'total_corrections': self._total, 'corrected_images': len(self._by_filename)}
+    
+    def iter_manifest(self, db, image_dir='web/static/uploads', batch_size=500):
+        """Labeled retraining samples: one per corrected image, joined with its analysis record"""
+        corrections = self.latest()
+        for start in range(0, len(corrections), batch_size):
+            chunk = corrections[start:start + batch_size]
+            analyses = db.latest_by_filename(c['filename'] for c in chunk)
+            for correction in chunk:
+                yield self.manifest_record(correction, analyses.get(correction['filename']), image_dir)
+    
+    @staticmethod
+    def manifest_record(correction, analysis, image_dir):
+        image_path = os.path.join(image_dir, correction['filename'])
+        label = f"{correction['correct_fruit']}_{correction['correct_condition']}".lower().replace(' ', '_')
+        return {
+            'image_path': image_path,
+            'image_exists': os.path.exists(image_path),
+            'label': label,
+            'correct_fruit': correction['correct_fruit'],
+            'correct_condition': correction['correct_condition'],
+            'original_prediction': correction.get('original_prediction'),
+            'corrected_at': correction.get('timestamp'),
+            'analysis_id': analysis['id'] if analysis else None,
+            'predicted_fruit': analysis['fruit'] if analysis else None,
+            'predicted_condition': analysis['condition'] if analysis else None,
+            'predicted_confidence': analysis['confidence'] if analysis else None,
+            'analyzed_at': analysis['timestamp'] if analysis else None
+        }
+    
+    def _catch_up(self):
+        """Fold corrections appended since the last call, by any thread or process, into the index"""
+        with self._lock:
+            records, self._offset = self.journal.read_from(self._offset)
+            for record in records:
+                filename = record.get('filename')
+                if not filename:
+                    continue
+                self._total += 1
+                # Re-insert so dict order follows each image's latest correction
+                self._by_filename.pop(filename, None)
+                self._by_filename[filename] = record
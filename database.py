@@ -1,10 +1,56 @@
+import base64
 import json
 import os
-from datetime import datetime
+import sqlite3
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
 
-class AnalysisDatabase:
+def parse_confidence(confidence):
+    """Numeric value of a confidence string such as '95.3%'"""
+    try:
+        return float(str(confidence).replace('%', ''))
+    except ValueError:
+        return None
+
+def matches_filters(analysis, filters):
+    """Python equivalent of the SQLite history filters"""
+    if filters.get('fruit') and analysis['fruit'].lower() != filters['fruit'].lower():
+        return False
+    if filters.get('condition') and analysis['condition'].lower() != filters['condition'].lower():
+        return False
+    if filters.get('status'):
+        is_healthy = 'healthy' in analysis['condition'].lower()
+        if is_healthy != (filters['status'] == 'healthy'):
+            return False
+    if filters.get('date_from') and analysis['timestamp'] < filters['date_from']:
+        return False
+    if filters.get('date_to') and analysis['timestamp'] >= filters['date_to']:
+        return False
+    confidence = parse_confidence(analysis['confidence'])
+    if filters.get('min_confidence') is not None and (confidence is None or confidence < filters['min_confidence']):
+        return False
+    if filters.get('max_confidence') is not None and (confidence is None or confidence > filters['max_confidence']):
+        return False
+    return True
+
+def encode_cursor(analysis):
+    """Opaque pagination cursor for the position after analysis"""
+    return base64.urlsafe_b64encode(json.dumps([analysis['timestamp'], analysis['id']]).encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        timestamp, analysis_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(timestamp), int(analysis_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+class JSONStorage:
+    """Original storage: every analysis in one JSON file, rewritten on each insert"""
+    
     def __init__(self, db_file='analysis_data.json'):
         self.db_file = db_file
+        self._lock = threading.Lock()
         self.data = self.load_data()
     
     def load_data(self):
@@ -28,65 +74,437 @@ class AnalysisDatabase:
         with open(self.db_file, 'w') as f:
             json.dump(self.data, f, indent=2)
     
-    def add_analysis(self, fruit, condition, confidence, filename):
-        analysis = {
-            'id': len(self.data['analyses']) + 1,
-            'fruit': fruit,
-            'condition': condition,
-            'confidence': confidence,
-            'filename': filename,
-            'timestamp': datetime.now().isoformat(),
-            'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
-        
-        self.data['analyses'].append(analysis)
-        self.update_stats()
-        self.save_data()
+    def add(self, analysis):
+        with self._lock:
+            analysis = dict(analysis, id=len(self.data['analyses']) + 1)
+            self.data['analyses'].append(analysis)
+            
+            stats = self.data['stats']
+            stats['total'] = stats.get('total', 0) + 1
+            if 'healthy' in analysis['condition'].lower():
+                stats['healthy'] = stats.get('healthy', 0) + 1
+            else:
+                stats['diseased'] = stats.get('diseased', 0) + 1
+            self.save_data()
         return analysis
     
-    def update_stats(self):
-        total = len(self.data['analyses'])
-        healthy = sum(1 for a in self.data['analyses'] if 'healthy' in a['condition'].lower())
-        diseased = total - healthy
-        
-        self.data['stats'] = {
-            'total': total,
-            'healthy': healthy,
-            'diseased': diseased,
-            'accuracy': '99.9%'
-        }
+    def count(self):
+        return len(self.data['analyses'])
+    
+    def iter_since(self, last_id):
+        """Analyses with an id above last_id, in insertion order"""
+        return iter(self.data['analyses'][last_id:])
+    
+    def history(self):
+        return sorted(self.data['analyses'], key=lambda x: x['timestamp'], reverse=True)
     
-    def get_stats(self):
-        # Generate trend data
-        analyses_by_date = {}
+    def latest_by_filename(self, filenames):
+        """Newest analysis for each of the given upload filenames"""
+        wanted = set(filenames)
+        latest = {}
         for analysis in self.data['analyses']:
-            date = analysis['timestamp'][:10]  # YYYY-MM-DD
-            analyses_by_date[date] = analyses_by_date.get(date, 0) + 1
+            filename = analysis.get('filename')
+            if filename in wanted and (filename not in latest or analysis['timestamp'] >= latest[filename]['timestamp']):
+                latest[filename] = analysis
+        return latest
+    
+    def query(self, filters, limit=None, cursor=None, columns=None):
+        """Newest-first analyses matching filters, starting after cursor (timestamp, id)"""
+        return list(self.iter_query(filters, limit, cursor, columns))
+    
+    def iter_query(self, filters, limit=None, cursor=None, columns=None):
+        count = 0
+        for analysis in self.history():
+            if limit is not None and count >= limit:
+                return
+            if cursor and (analysis['timestamp'], analysis['id']) >= tuple(cursor):
+                continue
+            if not matches_filters(analysis, filters):
+                continue
+            count += 1
+            yield {c: analysis[c] for c in columns} if columns else analysis
+
+class SQLiteStorage:
+    """Indexed SQLite storage in WAL mode; inserts are single-row transactions"""
+    
+    SCHEMA = [
+        '''CREATE TABLE IF NOT EXISTS analyses (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            fruit TEXT NOT NULL,
+            condition TEXT NOT NULL,
+            confidence TEXT,
+            confidence_value REAL,
+            is_healthy INTEGER NOT NULL,
+            filename TEXT,
+            timestamp TEXT NOT NULL,
+            date TEXT NOT NULL
+        )''',
+        'CREATE INDEX IF NOT EXISTS idx_analyses_timestamp ON analyses (timestamp, id)',
+        'CREATE INDEX IF NOT EXISTS idx_analyses_filename ON analyses (filename)',
+        'CREATE INDEX IF NOT EXISTS idx_analyses_fruit ON analyses (fruit COLLATE NOCASE, timestamp, id)',
+        'CREATE INDEX IF NOT EXISTS idx_analyses_condition ON analyses (condition COLLATE NOCASE, timestamp, id)',
+        'CREATE INDEX IF NOT EXISTS idx_analyses_healthy ON analyses (is_healthy, timestamp, id)',
+        'CREATE INDEX IF NOT EXISTS idx_analyses_confidence ON analyses (confidence_value)'
+    ]
+    
+    COLUMNS = ('id', 'fruit', 'condition', 'confidence', 'filename', 'timestamp', 'date')
+    
+    def __init__(self, db_file='analysis_data.db'):
+        self.db_file = db_file
+        self._local = threading.local()
         
-        # Get last 7 days
-        dates = sorted(analyses_by_date.keys())[-7:] if analyses_by_date else []
-        values = [analyses_by_date.get(date, 0) for date in dates]
+        conn = self._connect()
+        with conn:
+            for statement in self.SCHEMA:
+                conn.execute(statement)
+    
+    def _connect(self):
+        """One connection per thread and process; SQLite connections must not cross threads or forks"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_file, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+    
+    def add(self, analysis):
+        conn = self._connect()
+        with conn:
+            cursor = conn.execute(
+                '''INSERT INTO analyses (fruit, condition, confidence, confidence_value, is_healthy,
+                                         filename, timestamp, date)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                self._row_values(analysis)
+            )
+        return dict(analysis, id=cursor.lastrowid)
+    
+    def add_many(self, analyses):
+        """Insert many analyses, keeping their ids, in one transaction"""
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                '''INSERT OR IGNORE INTO analyses (id, fruit, condition, confidence, confidence_value,
+                                                   is_healthy, filename, timestamp, date)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                [(a.get('id'),) + self._row_values(a) for a in analyses]
+            )
+    
+    def count(self):
+        return self._connect().execute('SELECT COUNT(*) FROM analyses').fetchone()[0]
+    
+    def iter_since(self, last_id):
+        """Analyses with an id above last_id, in commit order"""
+        cursor = self._connect().execute(
+            f"SELECT {', '.join(self.COLUMNS)} FROM analyses WHERE id > ? ORDER BY id", (last_id,))
+        for row in cursor:
+            yield dict(row)
+    
+    def history(self):
+        rows = self._connect().execute(
+            f"SELECT {', '.join(self.COLUMNS)} FROM analyses ORDER BY timestamp DESC, id DESC")
+        return [dict(row) for row in rows]
+    
+    def latest_by_filename(self, filenames):
+        """Newest analysis for each of the given upload filenames, looked up through the filename index"""
+        latest = {}
+        filenames = list(filenames)
+        # Stay under SQLite's bound-parameter limit
+        for start in range(0, len(filenames), 500):
+            chunk = filenames[start:start + 500]
+            rows = self._connect().execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM analyses WHERE filename IN ({', '.join('?' * len(chunk))}) "
+                "ORDER BY timestamp, id",
+                chunk
+            )
+            for row in rows:
+                latest[row['filename']] = dict(row)
+        return latest
+    
+    def query(self, filters, limit=None, cursor=None, columns=None):
+        """Newest-first analyses matching filters, starting after cursor (timestamp, id)"""
+        return list(self.iter_query(filters, limit, cursor, columns))
+    
+    def iter_query(self, filters, limit=None, cursor=None, columns=None):
+        """Like query, but streams rows from the database cursor one at a time"""
+        clauses, params = [], []
+        for column in ('fruit', 'condition'):
+            if filters.get(column):
+                clauses.append(f"{column} = ? COLLATE NOCASE")
+                params.append(filters[column])
+        if filters.get('status'):
+            clauses.append('is_healthy = ?')
+            params.append(int(filters['status'] == 'healthy'))
+        if filters.get('date_from'):
+            clauses.append('timestamp >= ?')
+            params.append(filters['date_from'])
+        if filters.get('date_to'):
+            clauses.append('timestamp < ?')
+            params.append(filters['date_to'])
+        if filters.get('min_confidence') is not None:
+            clauses.append('confidence_value >= ?')
+            params.append(filters['min_confidence'])
+        if filters.get('max_confidence') is not None:
+            clauses.append('confidence_value <= ?')
+            params.append(filters['max_confidence'])
+        if cursor:
+            clauses.append('(timestamp, id) < (?, ?)')
+            params.extend(cursor)
         
-        # Generate distribution data
-        fruit_counts = {}
-        for analysis in self.data['analyses']:
-            fruit = analysis['fruit'].title()
-            fruit_counts[fruit] = fruit_counts.get(fruit, 0) + 1
+        sql = f"SELECT {', '.join(columns or self.COLUMNS)} FROM analyses"
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += ' ORDER BY timestamp DESC, id DESC'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        
+        for row in self._connect().execute(sql, params):
+            yield dict(row)
+    
+    @staticmethod
+    def _row_values(analysis):
+        return (
+            analysis['fruit'],
+            analysis['condition'],
+            analysis['confidence'],
+            parse_confidence(analysis['confidence']),
+            int('healthy' in analysis['condition'].lower()),
+            analysis['filename'],
+            analysis['timestamp'],
+            analysis['date']
+        )
+
+def migrate_json_to_sqlite(json_file='analysis_data.json', sqlite_file='analysis_data.db'):
+    """One-shot import of the JSON history into SQLite; returns the number of analyses imported"""
+    analyses = JSONStorage(json_file).data.get('analyses', [])
+    storage = SQLiteStorage(sqlite_file)
+    before = storage.count()
+    storage.add_many(analyses)
+    return storage.count() - before
+
+class StatsRollup:
+    """Counters per day, hour, fruit and condition, maintained incrementally.
+    
+    catch_up() folds in only analyses stored since the last call (ids grow
+    in commit order), so statistics never rescan the history and stay
+    correct when several processes write to the same database.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+    
+    def reset(self):
+        self.last_id = 0
+        self.total = 0
+        self.healthy = 0
+        self.by_day = Counter()
+        self.by_hour = Counter()
+        self.healthy_by_day = Counter()
+        self.healthy_by_hour = Counter()
+        self.by_fruit = Counter()
+        self.by_condition = Counter()
+        self.fruit_by_day = defaultdict(Counter)
+        self.condition_by_day = defaultdict(Counter)
+    
+    def add(self, analysis):
+        """Fold one analysis into every counter - O(1)"""
+        day = analysis['timestamp'][:10]  # YYYY-MM-DD
+        hour = analysis['timestamp'][:13]  # YYYY-MM-DDTHH
+        fruit = analysis['fruit'].title()
+        condition = analysis['condition'].title()
+        is_healthy = 'healthy' in analysis['condition'].lower()
+        
+        self.total += 1
+        self.by_day[day] += 1
+        self.by_hour[hour] += 1
+        self.by_fruit[fruit] += 1
+        self.by_condition[condition] += 1
+        self.fruit_by_day[day][fruit] += 1
+        self.condition_by_day[day][condition] += 1
+        if is_healthy:
+            self.healthy += 1
+            self.healthy_by_day[day] += 1
+            self.healthy_by_hour[hour] += 1
+        self.last_id = max(self.last_id, analysis['id'])
+    
+    def catch_up(self, storage):
+        with self._lock:
+            for analysis in storage.iter_since(self.last_id):
+                self.add(analysis)
+    
+    def rebuild(self, storage):
+        with self._lock:
+            self.reset()
+            for analysis in storage.iter_since(0):
+                self.add(analysis)
+    
+    def summary(self, days=None, bucket='day'):
+        with self._lock:
+            if days is None:
+                return self._summary_all()
+            return self._summary_window(days, bucket)
+    
+    def _summary_all(self):
+        # Get last 7 days
+        dates = sorted(self.by_day)[-7:]
+        values = [self.by_day[date] for date in dates]
         
         return {
-            'total': self.data['stats']['total'],
-            'healthy': self.data['stats']['healthy'],
-            'diseased': self.data['stats']['diseased'],
-            'accuracy': self.data['stats']['accuracy'],
+            'total': self.total,
+            'healthy': self.healthy,
+            'diseased': self.total - self.healthy,
+            'accuracy': '99.9%',
             'trend': {
                 'labels': dates or ['No Data'],
                 'values': values or [0]
             },
+            'distribution': {
+                'labels': list(self.by_fruit.keys()) or ['No Data'],
+                'values': list(self.by_fruit.values()) or [1]
+            },
+            'conditions': dict(self.by_condition)
+        }
+    
+    def _summary_window(self, days, bucket):
+        now = datetime.now()
+        day_keys = [(now - timedelta(days=offset)).strftime('%Y-%m-%d') for offset in range(days - 1, -1, -1)]
+        
+        if bucket == 'hour':
+            hour_keys = [(now - timedelta(hours=offset)).strftime('%Y-%m-%dT%H') for offset in range(days * 24 - 1, -1, -1)]
+            labels = [key.replace('T', ' ') + ':00' for key in hour_keys]
+            values = [self.by_hour[key] for key in hour_keys]
+            total = sum(values)
+            healthy = sum(self.healthy_by_hour[key] for key in hour_keys)
+        else:
+            labels = day_keys
+            values = [self.by_day[key] for key in day_keys]
+            total = sum(values)
+            healthy = sum(self.healthy_by_day[key] for key in day_keys)
+        
+        fruit_counts = Counter()
+        condition_counts = Counter()
+        for key in day_keys:
+            fruit_counts.update(self.fruit_by_day.get(key, {}))
+            condition_counts.update(self.condition_by_day.get(key, {}))
+        
+        return {
+            'total': total,
+            'healthy': healthy,
+            'diseased': total - healthy,
+            'accuracy': '99.9%',
+            'window_days': days,
+            'bucket': bucket,
+            'trend': {
+                'labels': labels,
+                'values': values
+            },
             'distribution': {
                 'labels': list(fruit_counts.keys()) or ['No Data'],
                 'values': list(fruit_counts.values()) or [1]
-            }
+            },
+            'conditions': dict(condition_counts)
+        }
+
+class AnalysisDatabase:
+    def __init__(self, db_file='analysis_data.json', backend='sqlite'):
+        self.db_file = db_file
+        
+        if backend == 'json':
+            self.storage = JSONStorage(db_file)
+        elif backend == 'sqlite':
+            sqlite_file = os.path.splitext(db_file)[0] + '.db'
+            self.storage = SQLiteStorage(sqlite_file)
+            # First start on SQLite: bring over the existing JSON history
+            if self.storage.count() == 0 and os.path.exists(db_file):
+                imported = migrate_json_to_sqlite(db_file, sqlite_file)
+                print(f"Imported {imported} analyses from {db_file} into {sqlite_file}")
+        else:
+            raise ValueError(f"Unknown database backend '{backend}', expected 'json' or 'sqlite'")
+        
+        # Aggregates are built once here and then folded forward with each new analysis
+        self.rollup = StatsRollup()
+        self.rollup.rebuild(self.storage)
+    
+    def add_analysis(self, fruit, condition, confidence, filename):
+        analysis = {
+            'fruit': fruit,
+            'condition': condition,
+            'confidence': confidence,
+            'filename': filename,
+            'timestamp': datetime.now().isoformat(),
+            'date': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         }
+        
+        return self.storage.add(analysis)
+    
+    def get_stats(self, days=None, bucket='day'):
+        """Dashboard statistics from the maintained rollups.
+        
+        Without days the trend covers the last 7 days that have analyses,
+        as before. With days it covers that calendar window, in daily or
+        hourly buckets, and the counts and distribution are limited to it.
+        """
+        self.rollup.catch_up(self.storage)
+        return self.rollup.summary(days, bucket)
+    
+    def rebuild_stats(self):
+        """Recompute the rollups from the stored analyses"""
+        self.rollup.rebuild(self.storage)
+        return self.rollup.summary()
+    
+    # Fields returned by the summary projection used by list views
+    SUMMARY_FIELDS = ('id', 'fruit', 'condition', 'confidence', 'date', 'filename')
     
     def get_history(self):
-        return sorted(self.data['analyses'], key=lambda x: x['timestamp'], reverse=True)
\ No newline at end of file
+        return self.storage.history()
+    
+    def query_history(self, limit=100, cursor=None, fields='full', **filters):
+        """One page of newest-first history and the cursor for the next page.
+        
+        Filters: fruit, condition, status ('healthy'/'diseased'), date_from,
+        date_to (dates are inclusive), min_confidence, max_confidence.
+        """
+        filters = self.normalize_filters(filters)
+        columns = self.SUMMARY_FIELDS if fields == 'summary' else None
+        position = decode_cursor(cursor) if cursor else None
+        
+        # Fetch one extra row to know whether another page exists; the cursor needs timestamp and id
+        query_columns = tuple(columns) + ('timestamp',) if columns else None
+        rows = self.storage.query(filters, limit=limit + 1, cursor=position, columns=query_columns)
+        
+        next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+        rows = rows[:limit]
+        if columns:
+            rows = [{c: row[c] for c in columns} for row in rows]
+        return rows, next_cursor
+    
+    def latest_by_filename(self, filenames):
+        """Newest analysis recorded for each upload filename; filenames without one are left out"""
+        return self.storage.latest_by_filename(filenames)
+    
+    def iter_history(self, **filters):
+        """Stream every matching analysis, newest first, without loading the history into memory"""
+        return self.storage.iter_query(self.normalize_filters(filters))
+    
+    @staticmethod
+    def normalize_filters(filters):
+        """Validate filter values; a date-only date_to includes that whole day"""
+        normalized = {key: value for key, value in filters.items() if value not in (None, '')}
+        
+        if normalized.get('status') not in (None, 'healthy', 'diseased'):
+            raise ValueError("status must be 'healthy' or 'diseased'")
+        for key in ('date_from', 'date_to'):
+            if key in normalized:
+                datetime.fromisoformat(normalized[key])
+        if len(normalized.get('date_to', '')) == 10:
+            day = datetime.fromisoformat(normalized['date_to']) + timedelta(days=1)
+            normalized['date_to'] = day.strftime('%Y-%m-%d')
+        for key in ('min_confidence', 'max_confidence'):
+            if key in normalized:
+                normalized[key] = float(normalized[key])
+        
+        return normalized
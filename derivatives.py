@@ -0,0 +1,184 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+# Processed views shown on the result page
+DERIVATIVE_KINDS = ('preprocessed', 'rotated', 'blurred', 'cropped', 'edges')
+
+def render_derivative(img_array, kind):
+    """Compute one processed view of an RGB image, returned as RGB"""
+    if kind == 'preprocessed':
+        # Preprocessed - resize to 224x224
+        return cv2.resize(img_array, (224, 224))
+    if kind == 'rotated':
+        # Rotated - 90 degrees clockwise
+        return cv2.rotate(img_array, cv2.ROTATE_90_CLOCKWISE)
+    if kind == 'blurred':
+        # Blurred - Gaussian blur
+        return cv2.GaussianBlur(img_array, (5, 5), 0)
+    if kind == 'cropped':
+        # Cropped - center crop
+        h, w = img_array.shape[:2]
+        crop_size = min(h, w) // 2
+        start_x = (w - crop_size) // 2
+        start_y = (h - crop_size) // 2
+        return img_array[start_y:start_y+crop_size, start_x:start_x+crop_size]
+    if kind == 'edges':
+        # Edges - Canny edge detection
+        gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
+        edges = cv2.Canny(gray, 100, 200)
+        return cv2.cvtColor(edges, cv2.COLOR_GRAY2RGB)
+    raise ValueError(f"Unknown derivative '{kind}', expected one of {list(DERIVATIVE_KINDS)}")
+
+class DerivativeStore:
+    """On-demand, disk-cached processed views of uploaded images.
+    
+    A derivative is rendered the first time its URL is requested and kept
+    in cache_dir, whose total size is bounded by evicting the least
+    recently used files. With workers > 0, pregenerate() renders all views
+    of a new upload on a background pool.
+    
+    Several server processes (serve.py) share cache_dir, so the disk is the
+    source of truth: a hit refreshes the file's mtime as its recency, a
+    view another process rendered is picked up instead of rendered again,
+    and the index is rebuilt from the directory before evicting, so the
+    size bound covers every process's files.
+    """
+    
+    # Seconds after which the index is rebuilt to pick up other processes' files and evictions
+    RESCAN_INTERVAL = 30.0
+    
+    def __init__(self, load_original, cache_dir='web/static/derivatives', max_disk_mb=512, workers=0):
+        self.load_original = load_original
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = int(max_disk_mb * 1024 * 1024)
+        
+        self._files = OrderedDict()  # path -> size, least recently used first
+        self._disk_bytes = 0
+        self._scanned_at = 0.0
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers) if workers > 0 else None
+        
+        self.generated = 0
+        self.hits = 0
+        self.evicted = 0
+        
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with self._lock:
+            self._scan()
+            self._evict()
+    
+    def path_for(self, filename, kind, img_array=None):
+        """Path of a derivative on disk, rendering it first if it is not cached"""
+        if kind not in DERIVATIVE_KINDS:
+            raise ValueError(f"Unknown derivative '{kind}'")
+        
+        path = os.path.join(self.cache_dir, kind, os.path.basename(filename))
+        try:
+            # Also finds views written by another process
+            os.utime(path)
+            size = os.path.getsize(path)
+        except OSError:
+            pass
+        else:
+            with self._lock:
+                self._disk_bytes += size - self._files.get(path, 0)
+                self._files[path] = size
+                self._files.move_to_end(path)
+                self.hits += 1
+            return path
+        
+        try:
+            if img_array is None:
+                img_array = self.load_original(filename)
+            rendered = render_derivative(img_array, kind)
+        except FileNotFoundError:
+            raise
+        except Exception as e:
+            raise ValueError(f"{filename} is not a readable image: {e}") from e
+        self._write(path, rendered)
+        return path
+    
+    def pregenerate(self, filename, img_array):
+        """Render every derivative of a new upload in the background, when a pool is configured"""
+        if self._pool is None:
+            return
+        for kind in DERIVATIVE_KINDS:
+            self._pool.submit(self._pregenerate_one, filename, kind, img_array)
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'files': len(self._files),
+                'disk_bytes': self._disk_bytes,
+                'max_disk_bytes': self.max_disk_bytes,
+                'generated': self.generated,
+                'hits': self.hits,
+                'evicted': self.evicted
+            }
+    
+    def _pregenerate_one(self, filename, kind, img_array):
+        try:
+            self.path_for(filename, kind, img_array)
+        except Exception as e:
+            print(f"Warning: Could not pre-generate {kind} view of {filename}: {e}")
+    
+    def _write(self, path, rgb_array):
+        ok, encoded = cv2.imencode('.jpg', cv2.cvtColor(rgb_array, cv2.COLOR_RGB2BGR))
+        if not ok:
+            raise ValueError(f"Could not encode {path}")
+        
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(encoded.tobytes())
+        os.replace(tmp_path, path)
+        
+        with self._lock:
+            self._disk_bytes += encoded.size - self._files.get(path, 0)
+            self._files[path] = encoded.size
+            self._files.move_to_end(path)
+            self.generated += 1
+            self._evict()
+    
+    def _scan(self):
+        """Rebuild the index from the files on disk, least recently used first by mtime"""
+        self._files.clear()
+        self._disk_bytes = 0
+        self._scanned_at = time.monotonic()
+        
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue  # evicted by another process meanwhile
+                entries.append((stat.st_mtime, path, stat.st_size))
+        
+        for _, path, size in sorted(entries):
+            self._files[path] = size
+            self._disk_bytes += size
+    
+    def _evict(self):
+        # Other processes add files too: check against the directory before trusting this process's count
+        if self._disk_bytes > self.max_disk_bytes or time.monotonic() - self._scanned_at > self.RESCAN_INTERVAL:
+            self._scan()
+        if self._disk_bytes <= self.max_disk_bytes:
+            return
+        # Down to a low-water mark, so the next few writes do not each trigger a rescan
+        while self._files and self._disk_bytes > self.max_disk_bytes * 0.9:
+            path, size = self._files.popitem(last=False)
+            self._disk_bytes -= size
+            self.evicted += 1
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+"""
+Export the trained model as a single self-contained bundle
+(architecture name, weights and class mapping) for offline deployment.
+"""
+
+import argparse
+
+from advanced_predictor import export_bundle
+
+def main():
+    parser = argparse.ArgumentParser(description='Export models/ as a single bundle file')
+    parser.add_argument('--model-path', default='models/')
+    parser.add_argument('--output', default=None, help='defaults to <model-path>/model_bundle.pt')
+    args = parser.parse_args()
+    
+    output_file = export_bundle(args.model_path, args.output)
+    print(f"Model bundle written to {output_file}")
+    print("The predictor loads it automatically when it sits in the model folder.")
+
+if __name__ == '__main__':
+    main()
@@ -1,61 +1,101 @@
 import json
 import os
+import threading
 from datetime import datetime
 
+from journal import JsonlJournal
+
+# Journal record type -> get_stats counter
+FEEDBACK_TYPES = {'rating': 'ratings', 'report': 'reports', 'suggestion': 'suggestions'}
+
 class FeedbackSystem:
-    def __init__(self, feedback_file='feedback_data.json'):
+    def __init__(self, feedback_file='feedback_data.json', journal_file='feedback_data.jsonl'):
+        # feedback_file is the legacy JSON store, imported once into the journal
         self.feedback_file = feedback_file
-        self._init_file()
+        self.journal = JsonlJournal(journal_file)
+        
+        self._lock = threading.Lock()
+        self._offset = 0
+        self._counts = {name: 0 for name in FEEDBACK_TYPES.values()}
+        self._rating_total = 0.0
+        self._rated = 0
+        
+        self._init_journal()
     
-    def _init_file(self):
+    def _init_journal(self):
+        """Import legacy feedback on first start, then compact the journal"""
+        if not self.journal.exists():
+            self.journal.compact(self._legacy_records())
+        else:
+            self.journal.compact()
+        self._catch_up()
+    
+    def _legacy_records(self):
         if not os.path.exists(self.feedback_file):
-            with open(self.feedback_file, 'w') as f:
-                json.dump({'ratings': [], 'reports': [], 'suggestions': []}, f)
+            return []
+        try:
+            with open(self.feedback_file, 'r') as f:
+                data = json.load(f)
+        except ValueError:
+            return []
+        if not isinstance(data, dict):
+            return []
+        
+        records = []
+        for record_type, key in FEEDBACK_TYPES.items():
+            for entry in data.get(key, []):
+                records.append(dict(entry, type=record_type))
+        return records
     
     def add_rating(self, prediction_id, rating, comment=''):
-        data = self._load()
-        data['ratings'].append({
+        self.journal.append({
+            'type': 'rating',
             'id': prediction_id,
             'rating': rating,
             'comment': comment,
             'timestamp': str(datetime.now())
         })
-        self._save(data)
     
     def add_report(self, prediction_id, issue, details=''):
-        data = self._load()
-        data['reports'].append({
+        self.journal.append({
+            'type': 'report',
             'id': prediction_id,
             'issue': issue,
             'details': details,
             'timestamp': str(datetime.now())
         })
-        self._save(data)
     
     def add_suggestion(self, feature, description=''):
-        data = self._load()
-        data['suggestions'].append({
+        self.journal.append({
+            'type': 'suggestion',
             'feature': feature,
             'description': description,
             'timestamp': str(datetime.now())
         })
-        self._save(data)
     
     def get_stats(self):
-        data = self._load()
-        ratings = data.get('ratings', [])
-        avg_rating = sum(r['rating'] for r in ratings) / len(ratings) if ratings else 0
-        return {
-            'total_ratings': len(ratings),
-            'average_rating': round(avg_rating, 2),
-            'total_reports': len(data.get('reports', [])),
-            'total_suggestions': len(data.get('suggestions', []))
-        }
-    
-    def _load(self):
-        with open(self.feedback_file, 'r') as f:
-            return json.load(f)
+        self._catch_up()
+        with self._lock:
+            avg_rating = self._rating_total / self._rated if self._rated else 0
+            return {
+                'total_ratings': self._counts['ratings'],
+                'average_rating': round(avg_rating, 2),
+                'total_reports': self._counts['reports'],
+                'total_suggestions': self._counts['suggestions']
+            }
     
-    def _save(self, data):
-        with open(self.feedback_file, 'w') as f:
-            json.dump(data, f, indent=2)
+    def _catch_up(self):
+        """Fold records appended since the last call (by any thread or process) into the aggregates"""
+        with self._lock:
+            records, self._offset = self.journal.read_from(self._offset)
+            for record in records:
+                key = FEEDBACK_TYPES.get(record.get('type'))
+                if key is None:
+                    continue
+                self._counts[key] += 1
+                if key == 'ratings':
+                    try:
+                        self._rating_total += float(record.get('rating'))
+                        self._rated += 1
+                    except (TypeError, ValueError):
+                        pass
@@ -0,0 +1,369 @@
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import connection, shared_memory
+
+import numpy as np
+
+from advanced_predictor import INPUT_SIZE
+
+IMAGE_SHAPE = (INPUT_SIZE, INPUT_SIZE, 3)
+
+def _worker_main(index, predictor_class, predictor_kwargs, shm_name, num_slots, conn, torch_threads, max_batch):
+    """Inference process: own predictor, images read from the shared slot arena"""
+    import torch
+
+    torch.set_num_threads(torch_threads)
+    predictor = predictor_class(**predictor_kwargs)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    arena = np.ndarray((num_slots,) + IMAGE_SHAPE, dtype=np.uint8, buffer=shm.buf)
+    if predictor.model is not None:
+        # Warm up before taking traffic, so the first request does not pay for it
+        predictor.predict_single(np.zeros(IMAGE_SHAPE, dtype=np.uint8))
+    conn.send(('ready', predictor.model_version))
+
+    try:
+        stopping = False
+        while not stopping:
+            # Block for one task, then take whatever else is already queued to batch it together
+            tasks = [conn.recv()]
+            while len(tasks) < max_batch and conn.poll():
+                tasks.append(conn.recv())
+            # None asks the worker to exit once the tasks queued before it are done
+            if None in tasks:
+                tasks = tasks[:tasks.index(None)]
+                stopping = True
+
+            by_mode = {}
+            for request_id, slot, tta_mode in tasks:
+                by_mode.setdefault(tta_mode, []).append((request_id, slot))
+
+            for tta_mode, items in by_mode.items():
+                try:
+                    if predictor.model is None:
+                        results = [predictor.no_model_result() for _ in items]
+                    else:
+                        images = arena[[slot for _, slot in items]]
+                        tensors = predictor.normalize_stack(images, out=predictor.input_buffer(len(items)))
+                        results = predictor.predict_tensors(tensors, tta_mode)
+                except Exception as e:
+                    results = [predictor.error_result(e) for _ in items]
+                conn.send(('results', [(request_id, result) for (request_id, _), result in zip(items, results)]))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        del arena
+        shm.close()
+
+class InferencePool:
+    """Out-of-process inference behind the same submit/predict interface as MicroBatchScheduler.
+
+    Each worker process holds its own AdvancedPredictor. Callers resize
+    their image in their own thread and copy it into a slot of a shared
+    memory arena; only the slot number travels over the worker's pipe.
+    Results come back as futures. A worker that crashes, or holds a
+    request past the timeout, is killed and restarted and its in-flight
+    requests fail with an error result; so is one that has not loaded its
+    model within startup_timeout. With workers=0 everything runs
+    in-process on the given predictor, which keeps tests free of
+    subprocesses.
+    """
+
+    def __init__(self, predictor, workers=2, timeout=30.0, max_batch=8, torch_threads=0, start_method='spawn',
+                 startup_timeout=300.0):
+        self.predictor = predictor
+        self.workers = workers
+        self.timeout = timeout
+        self.startup_timeout = startup_timeout
+        self.max_batch = max_batch
+        self.torch_threads = torch_threads or max(1, (os.cpu_count() or 1) // max(workers, 1))
+        self.start_method = start_method
+
+        self._lock = threading.Lock()
+        self._started_pid = None
+        self._ids = itertools.count()
+        self._workers = []
+        self._retiring = []  # replaced workers finishing their queued tasks
+        self._pending = {}  # request_id -> (future, slot, worker, submitted at)
+
+        self.requests = 0
+        self.timeouts = 0
+        self.restarts = 0
+        self.failed = 0
+
+    def submit(self, image, tta_mode=None):
+        """Queue an image for prediction and return a Future with its result"""
+        future = Future()
+        tta_mode = tta_mode or self.predictor.tta_mode
+
+        if self.predictor.model is None:
+            future.set_result(self.predictor.no_model_result())
+            return future
+
+        if self.workers == 0:
+            future.set_result(self.predictor.predict_single(image, tta_mode))
+            return future
+
+        try:
+            resized = self.predictor.load_image(image)
+        except Exception as e:
+            future.set_result(self.predictor.error_result(e))
+            return future
+
+        self._ensure_started()
+        try:
+            slot = self._free_slots.get(timeout=self.timeout)
+        except queue.Empty:
+            future.set_result(self.predictor.error_result(TimeoutError('No free inference slot')))
+            return future
+        self._arena[slot] = resized
+
+        with self._lock:
+            self.requests += 1
+            request_id = next(self._ids)
+            # Least loaded live worker
+            worker = min(self._workers, key=lambda w: len(w['in_flight']))
+            worker['in_flight'].add(request_id)
+            self._pending[request_id] = (future, slot, worker, time.monotonic())
+            try:
+                worker['conn'].send((request_id, slot, tta_mode))
+            except (OSError, ValueError):
+                pass  # the monitor fails this request when it restarts the worker
+        return future
+
+    def predict(self, image, tta_mode=None, timeout=None):
+        """Blocking helper: submit an image and wait for its result"""
+        return self.submit(image, tta_mode).result(timeout=timeout)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'alive': sum(1 for w in self._workers if w['process'].is_alive()),
+                'in_flight': len(self._pending),
+                'requests': self.requests,
+                'timeouts': self.timeouts,
+                'failed': self.failed,
+                'restarts': self.restarts
+            }
+
+    def swap_predictor(self, predictor, ready_timeout=300.0):
+        """Rolling restart onto a new predictor's settings and weights.
+        
+        Each worker is replaced only once its successor has loaded and
+        warmed up; the old one finishes the requests already queued to it.
+        Workers load the checkpoint copy the predictor was built from, so
+        the weights they run are the predictor's even if the files in its
+        model_path have since been replaced.
+        """
+        previous = self.predictor
+        # Set first, so a worker restarted during the swap already comes up on the new model
+        self.predictor = predictor
+        if self._started_pid != os.getpid():
+            return
+        
+        for index in range(self.workers):
+            successor = self._start_worker(index, predictor)
+            if not successor['conn'].poll(ready_timeout):
+                successor['process'].kill()
+                # Put the workers already swapped back on the previous model: once killed,
+                # the result thread restarts them from self.predictor
+                self.predictor = previous
+                with self._lock:
+                    swapped = self._workers[:index]
+                for worker in swapped:
+                    worker['process'].kill()
+                raise TimeoutError(f'Inference worker {index} did not become ready')
+            successor['conn'].recv()
+            successor['ready'] = True
+            
+            with self._lock:
+                retired = self._workers[index]
+                self._workers[index] = successor
+                self._retiring.append(retired)
+            self._wake_writer.send(None)
+            try:
+                retired['conn'].send(None)
+            except (OSError, ValueError):
+                pass
+
+    def close(self):
+        """Stop the worker processes and release the shared memory"""
+        with self._lock:
+            workers, self._workers = self._workers, []
+            self._started_pid = None
+        for worker in workers:
+            try:
+                worker['conn'].send(None)
+            except (OSError, ValueError):
+                pass
+        for worker in workers:
+            worker['process'].join(timeout=5)
+            if worker['process'].is_alive():
+                worker['process'].kill()
+        if hasattr(self, '_shm'):
+            self._shm.close()
+            self._shm.unlink()
+
+    def _ensure_started(self):
+        # Started on first use and per process, so a prefork master never owns the pool
+        if self._started_pid == os.getpid():
+            return
+        with self._lock:
+            if self._started_pid == os.getpid():
+                return
+
+            num_slots = self.workers * self.max_batch * 2
+            self._context = multiprocessing.get_context(self.start_method)
+            self._shm = shared_memory.SharedMemory(create=True, size=num_slots * int(np.prod(IMAGE_SHAPE)))
+            self._arena = np.ndarray((num_slots,) + IMAGE_SHAPE, dtype=np.uint8, buffer=self._shm.buf)
+            self._free_slots = queue.Queue()
+            for slot in range(num_slots):
+                self._free_slots.put(slot)
+            # Wakes the result thread when the set of workers changes
+            self._wake_reader, self._wake_writer = multiprocessing.Pipe(duplex=False)
+
+            self._workers = [self._start_worker(index) for index in range(self.workers)]
+            self._started_pid = os.getpid()
+            threading.Thread(target=self._run, name='inference-pool', daemon=True).start()
+
+    def _start_worker(self, index, predictor=None):
+        parent_conn, child_conn = self._context.Pipe()
+        predictor = predictor or self.predictor
+        process = self._context.Process(
+            target=_worker_main,
+            args=(index, type(predictor), predictor.pinned_init_kwargs(), self._shm.name, len(self._arena), child_conn,
+                  self.torch_threads, self.max_batch),
+            name=f'inference-worker-{index}',
+            daemon=True
+        )
+        process.start()
+        child_conn.close()
+        return {'index': index, 'process': process, 'conn': parent_conn, 'in_flight': set(), 'ready': False,
+                'started_at': time.monotonic()}
+
+    def _run(self):
+        """Resolve futures from worker results and restart crashed or stuck workers"""
+        while self._started_pid == os.getpid():
+            with self._lock:
+                conns = {w['conn']: w for w in self._workers + self._retiring}
+
+            for conn in connection.wait(list(conns) + [self._wake_reader], timeout=0.5):
+                if conn is self._wake_reader:
+                    conn.recv()
+                    continue
+                worker = conns[conn]
+                try:
+                    kind, payload = conn.recv()
+                except (EOFError, OSError):
+                    if worker in self._retiring:
+                        self._retire(worker)
+                    else:
+                        self._restart(worker, 'crashed')
+                    continue
+                if kind == 'ready':
+                    self._mark_ready(worker)
+                elif kind == 'results':
+                    self._resolve(worker, payload)
+
+            now = time.monotonic()
+            with self._lock:
+                workers = list(self._workers)
+                retiring = list(self._retiring)
+                # By worker, not index: during a swap a retiring worker and its successor share one
+                stuck = {
+                    id(worker) for _, _, worker, submitted in self._pending.values()
+                    if worker['ready'] and now - submitted > self.timeout
+                }
+                # Requests queued to a worker that never finishes loading would otherwise wait forever
+                not_started = {
+                    id(worker) for worker in workers
+                    if not worker['ready'] and now - worker['started_at'] > self.startup_timeout
+                }
+            for worker in retiring:
+                if id(worker) in stuck:
+                    self._retire(worker, timed_out=True)
+            for worker in workers:
+                if id(worker) in stuck:
+                    self._restart(worker, 'timed out')
+                elif id(worker) in not_started:
+                    self._restart(worker, 'did not start')
+                elif not worker['process'].is_alive():
+                    self._restart(worker, 'crashed')
+
+    def _mark_ready(self, worker):
+        # Model loading does not count against the timeout of requests already queued
+        now = time.monotonic()
+        with self._lock:
+            worker['ready'] = True
+            for request_id in worker['in_flight']:
+                if request_id in self._pending:
+                    future, slot, owner, _ = self._pending[request_id]
+                    self._pending[request_id] = (future, slot, owner, now)
+
+    def _resolve(self, worker, results):
+        for request_id, result in results:
+            with self._lock:
+                entry = self._pending.pop(request_id, None)
+                worker['in_flight'].discard(request_id)
+            if entry is None:
+                continue  # already failed by a restart
+            future, slot, _, _ = entry
+            self._free_slots.put(slot)
+            future.set_result(result)
+
+    def _retire(self, worker, timed_out=False):
+        """Reap a replaced worker that has exited, or kill one stuck on a request; anything unanswered fails"""
+        with self._lock:
+            if worker not in self._retiring:
+                return
+            self._retiring.remove(worker)
+        if timed_out:
+            worker['process'].kill()
+            print(f"Retiring inference worker {worker['index']} timed out, killed")
+        worker['process'].join()
+        worker['conn'].close()
+        
+        with self._lock:
+            failed = [self._pending.pop(request_id) for request_id in worker['in_flight']
+                      if request_id in self._pending]
+            if timed_out:
+                self.timeouts += len(failed)
+            self.failed += len(failed)
+        error = TimeoutError('Inference timed out') if timed_out else RuntimeError('Inference worker retired')
+        for future, slot, _, _ in failed:
+            self._free_slots.put(slot)
+            future.set_result(self.predictor.error_result(error))
+
+    def _restart(self, worker, reason):
+        # The replacement takes the worker's place at once, so a concurrent swap cannot retire it as well
+        with self._lock:
+            if worker not in self._workers:
+                return
+            self.restarts += 1
+            self._workers[self._workers.index(worker)] = self._start_worker(worker['index'])
+
+        worker['process'].kill()
+        worker['process'].join()
+        worker['conn'].close()
+        print(f"Inference worker {worker['index']} {reason}, restarting")
+
+        with self._lock:
+            failed = [(request_id, self._pending.pop(request_id)) for request_id in worker['in_flight']
+                      if request_id in self._pending]
+            if reason != 'crashed':
+                self.timeouts += len(failed)
+            self.failed += len(failed)
+
+        # The process is gone, so its slots can be reused
+        error = {
+            'timed out': TimeoutError('Inference timed out'),
+            'did not start': TimeoutError('Inference worker did not start')
+        }.get(reason, RuntimeError('Inference worker crashed'))
+        for _, (future, slot, _, _) in failed:
+            self._free_slots.put(slot)
+            future.set_result(self.predictor.error_result(error))
@@ -0,0 +1,125 @@
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+from metrics import metrics
+
+class MicroBatchScheduler:
+    """Dynamic micro-batching in front of an AdvancedPredictor.
+    
+    Request threads decode and resize their own image and enqueue it; a
+    single scheduler thread collects queued requests for up to max_wait_ms
+    or max_batch items, runs one batched forward and resolves each caller's
+    future with its own result.
+    """
+    
+    def __init__(self, predictor, max_batch=8, max_wait_ms=5.0):
+        self.predictor = predictor
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        
+        self.requests = 0
+        self.batches = 0
+        self.batch_sizes = Counter()
+        self.queue_depths = Counter()
+    
+    def submit(self, image, tta_mode=None):
+        """Queue an image for prediction and return a Future with its result"""
+        future = Future()
+        
+        if self.predictor.model is None:
+            future.set_result(self.predictor.no_model_result())
+            return future
+        
+        try:
+            resized = self.predictor.load_image(image)
+        except Exception as e:
+            future.set_result(self.predictor.error_result(e))
+            return future
+        
+        self._ensure_started()
+        self._queue.put((resized, tta_mode or self.predictor.tta_mode, future))
+        return future
+    
+    def predict(self, image, tta_mode=None, timeout=None):
+        """Blocking helper: submit an image and wait for its result"""
+        return self.submit(image, tta_mode).result(timeout=timeout)
+    
+    def swap_predictor(self, predictor):
+        """Use another predictor from the next batch on; a batch already running finishes on the old one"""
+        self.predictor = predictor
+    
+    def stats(self):
+        """Queue depth and batch-size histograms"""
+        with self._lock:
+            return {
+                'max_batch': self.max_batch,
+                'max_wait_ms': self.max_wait * 1000,
+                'queue_depth': self._queue.qsize(),
+                'requests': self.requests,
+                'batches': self.batches,
+                'average_batch_size': round(self.requests / self.batches, 2) if self.batches else 0,
+                'batch_size_histogram': dict(sorted(self.batch_sizes.items())),
+                'queue_depth_histogram': dict(sorted(self.queue_depths.items()))
+            }
+    
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='micro-batch-scheduler', daemon=True)
+                self._thread.start()
+    
+    def _collect(self):
+        """Block for the first request, then gather more until the batch is full or the wait expires"""
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        
+        return batch
+    
+    def _run(self):
+        while True:
+            batch = self._collect()
+            
+            with self._lock:
+                self.queue_depths[self._queue.qsize()] += 1
+                self.batch_sizes[len(batch)] += 1
+                self.requests += len(batch)
+                self.batches += 1
+            
+            # Requests with different TTA modes cannot share a view stack
+            by_mode = {}
+            for resized, tta_mode, future in batch:
+                by_mode.setdefault(tta_mode, []).append((resized, future))
+            
+            for tta_mode, items in by_mode.items():
+                self._predict_group(items, tta_mode)
+    
+    def _predict_group(self, items, tta_mode):
+        try:
+            # Normalize the whole group into the scheduler thread's reusable buffer
+            images = [resized for resized, _ in items]
+            with metrics.stage('preprocess'):
+                tensors = self.predictor.normalize_stack(images, out=self.predictor.input_buffer(len(images)))
+            results = self.predictor.predict_tensors(tensors, tta_mode)
+        except Exception as e:
+            results = [self.predictor.error_result(e) for _ in items]
+        
+        for (_, future), result in zip(items, results):
+            future.set_result(result)
@@ -0,0 +1,102 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: threads are still serialized, processes are not
+    fcntl = None
+
+class JsonlJournal:
+    """Append-only JSON Lines file, safe to share between threads and processes.
+    
+    Each append is one complete line written under a thread lock plus an
+    advisory file lock, then fsynced. A crash can at worst leave a torn
+    final line, which readers skip and the next append or compaction
+    repairs.
+    """
+    
+    def __init__(self, path, fsync=True):
+        self.path = path
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._lock_file = None
+        self._lock_pid = None
+    
+    def append(self, record):
+        line = (json.dumps(record) + '\n').encode('utf-8')
+        with self.locked():
+            with open(self.path, 'a+b') as f:
+                # Never glue a new record onto a torn line left by a crash
+                if f.tell() > 0:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b'\n':
+                        f.write(b'\n')
+                f.write(line)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+    
+    def read_from(self, offset=0):
+        """Complete records after byte offset, and the offset just past the last complete line"""
+        records = []
+        if not os.path.exists(self.path):
+            return records, offset
+        
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break  # torn or still being written
+                offset += len(line)
+                record = self._parse(line)
+                if record is not None:
+                    records.append(record)
+        return records, offset
+    
+    def compact(self, records=None):
+        """Atomically rewrite the journal with only valid records (or the given ones)"""
+        with self.locked():
+            if records is None:
+                records, _ = self.read_from(0)
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for record in records:
+                    f.write(json.dumps(record) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        return records
+    
+    def exists(self):
+        return os.path.exists(self.path)
+    
+    @contextmanager
+    def locked(self):
+        with self._lock:
+            lock_file = self._process_lock_file()
+            if lock_file is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if lock_file is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+    
+    def _process_lock_file(self):
+        # flock is tied to the open file, so a forked child needs its own handle
+        if fcntl is None:
+            return None
+        if self._lock_file is None or self._lock_pid != os.getpid():
+            self._lock_file = open(self.path + '.lock', 'a')
+            self._lock_pid = os.getpid()
+        return self._lock_file
+    
+    @staticmethod
+    def _parse(line):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            return None
+        return record if isinstance(record, dict) else None
@@ -0,0 +1,163 @@
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+class LiveSessionTracker:
+    """Temporal result reuse for live camera sessions.
+    
+    Each session remembers a difference hash of its last analyzed frame.
+    Frames whose hash is within change_threshold bits are the same scene:
+    the last result is reused, and every refresh_every reused frames it is
+    refreshed with a single non-TTA pass folded into a running average.
+    Only real scene changes pay for a full analysis.
+    """
+    
+    def __init__(self, change_threshold=6, refresh_every=5, session_ttl=300, max_sessions=1000):
+        self.change_threshold = change_threshold
+        self.refresh_every = refresh_every
+        self.session_ttl = session_ttl
+        self.max_sessions = max_sessions
+        
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        
+        self.counts = {'full': 0, 'reuse': 0, 'refresh': 0}
+    
+    @staticmethod
+    def frame_hash(img_array):
+        """64-bit difference hash of a downscaled grayscale frame"""
+        gray = cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY) if img_array.ndim == 3 else img_array
+        small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+        bits = (small[:, 1:] > small[:, :-1]).flatten()
+        return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+    
+    def check(self, session_id, frame_hash):
+        """Decide how to handle a frame: ('full', None), ('refresh', last) or ('reuse', last)"""
+        with self._lock:
+            self._expire()
+            state = self._sessions.get(session_id)
+            
+            if state is None or bin(state['hash'] ^ frame_hash).count('1') > self.change_threshold:
+                action = 'full'
+            elif state['reused'] + 1 >= self.refresh_every:
+                action = 'refresh'
+            else:
+                action = 'reuse'
+                state['reused'] += 1
+                state['seen'] = time.time()
+                self._sessions.move_to_end(session_id)
+            
+            self.counts[action] += 1
+            return action, dict(state['result']) if state else None
+    
+    def record(self, session_id, frame_hash, results):
+        """Store a full analysis as the session's new reference frame"""
+        with self._lock:
+            self._sessions[session_id] = {
+                'hash': frame_hash,
+                'result': dict(results),
+                'confidence_sum': self._confidence(results),
+                'samples': 1,
+                'reused': 0,
+                'seen': time.time()
+            }
+            self._sessions.move_to_end(session_id)
+            self._expire()
+    
+    def refresh(self, session_id, frame_hash, results):
+        """Fold a single-pass result into the running average.
+        
+        Returns the averaged result, or None when the prediction changed and
+        the frame needs a full analysis after all.
+        """
+        with self._lock:
+            state = self._sessions.get(session_id)
+            if state is None or results.get('prediction') != state['result'].get('prediction'):
+                return None
+            
+            state['confidence_sum'] += self._confidence(results)
+            state['samples'] += 1
+            state['result']['confidence'] = f"{state['confidence_sum'] / state['samples']:.1f}%"
+            state['hash'] = frame_hash
+            state['reused'] = 0
+            state['seen'] = time.time()
+            self._sessions.move_to_end(session_id)
+            return dict(state['result'])
+    
+    def stats(self):
+        with self._lock:
+            frames = sum(self.counts.values())
+            return dict(self.counts,
+                        active_sessions=len(self._sessions),
+                        reuse_rate=round(1 - self.counts['full'] / frames, 4) if frames else 0)
+    
+    @staticmethod
+    def _confidence(results):
+        try:
+            return float(str(results.get('confidence', '0')).replace('%', ''))
+        except ValueError:
+            return 0.0
+    
+    def _expire(self):
+        cutoff = time.time() - self.session_ttl
+        while self._sessions:
+            session_id, state = next(iter(self._sessions.items()))
+            if state['seen'] >= cutoff and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[session_id]
+
+class FramePacer:
+    """Adaptive frame rate for live clients.
+    
+    Keeps a moving average of per-frame processing time and counts the open
+    live streams. The suggested wait before a client's next frame is that
+    average times the number of streams sharing the model, so clients slow
+    down together as load rises instead of queueing frames.
+    """
+    
+    def __init__(self, min_interval_ms=150, max_interval_ms=2000, smoothing=0.2):
+        self.min_interval_ms = min_interval_ms
+        self.max_interval_ms = max_interval_ms
+        self.smoothing = smoothing
+        
+        self._lock = threading.Lock()
+        self.active = 0
+        self.frames = 0
+        self.dropped = 0
+        self.average_ms = 0.0
+    
+    def open(self):
+        with self._lock:
+            self.active += 1
+    
+    def close(self):
+        with self._lock:
+            self.active -= 1
+    
+    def drop(self):
+        """Count a frame superseded by a newer one before it was analyzed"""
+        with self._lock:
+            self.dropped += 1
+    
+    def record(self, elapsed_ms):
+        """Fold in one frame's processing time and return the next frame interval in ms"""
+        with self._lock:
+            self.frames += 1
+            if self.frames == 1:
+                self.average_ms = elapsed_ms
+            else:
+                self.average_ms += self.smoothing * (elapsed_ms - self.average_ms)
+            interval = self.average_ms * max(self.active, 1)
+            return int(min(max(interval, self.min_interval_ms), self.max_interval_ms))
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'active_streams': self.active,
+                'frames': self.frames,
+                'dropped_frames': self.dropped,
+                'average_frame_ms': round(self.average_ms, 2)
+            }
@@ -0,0 +1,134 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+
+# Histogram bucket upper bounds in seconds
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_NULL_STAGE = nullcontext()
+
+class _Stage:
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+class Metrics:
+    """Stage duration histograms and counters, rendered in Prometheus text format.
+
+    Stages are timed with `with metrics.stage('decode'):` and labelled with
+    the route of the request being handled on the current thread, or
+    'background' for work on scheduler and pool threads. When a request
+    ends its stages can be reported as a Server-Timing header. Disabled,
+    stage() hands back a shared no-op context and counters return at once.
+    """
+
+    def __init__(self, enabled=True, server_timing=False, buckets=STAGE_BUCKETS):
+        self.enabled = enabled
+        self.server_timing = server_timing
+        self.buckets = buckets
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._histograms = {}  # (route, stage) -> [bucket counts..., +Inf count], sum
+        self._counters = {}    # (name, labels) -> value
+
+    def configure(self, enabled=None, server_timing=None):
+        if enabled is not None:
+            self.enabled = enabled
+        if server_timing is not None:
+            self.server_timing = server_timing
+
+    def stage(self, name):
+        """Context manager timing one stage of the current request"""
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def observe(self, stage, seconds):
+        if not self.enabled:
+            return
+        route = getattr(self._local, 'route', None) or 'background'
+        timings = getattr(self._local, 'timings', None)
+        if timings is not None:
+            timings.append((stage, seconds))
+
+        index = bisect_left(self.buckets, seconds)
+        with self._lock:
+            histogram = self._histograms.get((route, stage))
+            if histogram is None:
+                histogram = self._histograms[(route, stage)] = [[0] * (len(self.buckets) + 1), 0.0]
+            histogram[0][index] += 1
+            histogram[1] += seconds
+
+    def count(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def begin_request(self, route):
+        if not self.enabled:
+            return
+        self._local.route = route
+        self._local.timings = []
+        self._local.start = time.perf_counter()
+
+    def end_request(self, status):
+        """Record the request total; returns a Server-Timing header value when enabled, else None"""
+        if not self.enabled or getattr(self._local, 'route', None) is None:
+            return None
+        self.observe('total', time.perf_counter() - self._local.start)
+        self.count('http_requests_total', route=self._local.route, status=str(status))
+
+        timings = self._local.timings
+        self._local.route = None
+        self._local.timings = None
+        if not self.server_timing:
+            return None
+        return ', '.join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            histograms = {key: (list(counts), total) for key, (counts, total) in self._histograms.items()}
+            counters = dict(self._counters)
+
+        lines = []
+        if histograms:
+            lines.append('# HELP fruit_stage_duration_seconds Time spent in each request stage')
+            lines.append('# TYPE fruit_stage_duration_seconds histogram')
+        for (route, stage), (counts, total) in sorted(histograms.items()):
+            labels = f'route="{route}",stage="{stage}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append(f'fruit_stage_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            cumulative += counts[-1]
+            lines.append(f'fruit_stage_duration_seconds_bucket{{{labels},le="+Inf"}} {cumulative}')
+            lines.append(f'fruit_stage_duration_seconds_sum{{{labels}}} {total:.6f}')
+            lines.append(f'fruit_stage_duration_seconds_count{{{labels}}} {cumulative}')
+
+        typed = set()
+        for (name, labels), value in sorted(counters.items()):
+            if name not in typed:
+                lines.append(f'# TYPE fruit_{name} counter')
+                typed.add(name)
+            label_text = ','.join(f'{key}="{val}"' for key, val in labels)
+            lines.append(f'fruit_{name}{{{label_text}}} {value}' if label_text else f'fruit_{name} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+# Process-wide registry shared by the app and the inference code
+metrics = Metrics()
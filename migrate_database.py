@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+"""
+One-shot migration of analysis_data.json into the SQLite analysis database.
+Safe to re-run: analyses that are already imported are skipped.
+"""
+
+import argparse
+
+from database import migrate_json_to_sqlite
+
+def main():
+    parser = argparse.ArgumentParser(description='Import the JSON analysis history into SQLite')
+    parser.add_argument('--json-file', default='analysis_data.json')
+    parser.add_argument('--sqlite-file', default='analysis_data.db')
+    args = parser.parse_args()
+    
+    imported = migrate_json_to_sqlite(args.json_file, args.sqlite_file)
+    print(f"Imported {imported} analyses from {args.json_file} into {args.sqlite_file}")
+
+if __name__ == '__main__':
+    main()
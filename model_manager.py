@@ -0,0 +1,263 @@
+import json
+import os
+import signal
+import threading
+import time
+
+import numpy as np
+
+from advanced_predictor import BUNDLE_FILENAME
+
+class ModelManager:
+    """Zero-downtime model replacement for an EnhancedFruitDiseaseDetector.
+
+    reload() builds a new predictor on a background thread, warms
+    it up with a few inferences per TTA mode and only then swaps it into
+    the detector. Requests already running finish on the old predictor,
+    which is kept for rollback(). With watch_interval > 0 the model files
+    are polled and a changed checkpoint is reloaded automatically.
+
+    Under serve.py every worker is forked from one master, so a change
+    made in a single worker would leave the others on the old model.
+    There master is set to a MasterChannel: request_reload() and
+    request_rollback() hand the change to the master, which applies it
+    and forks fresh workers from the result. The master then skips the
+    warm-up, since forward passes before fork() can leave the children's
+    OpenMP pool deadlocked; each new worker calls warm_up() instead.
+    """
+
+    WATCHED_FILES = (BUNDLE_FILENAME, 'best_model.pth', 'class_mapping.json')
+
+    def __init__(self, detector, watch_interval=0, warmup_runs=3):
+        self.detector = detector
+        self.watch_interval = watch_interval
+        self.warmup_runs = warmup_runs
+
+        self._lock = threading.Lock()
+        self._loading = None
+        self._watcher_pid = None
+        self._previous = None
+
+        predictor = detector.predictor
+        self.active = self._describe(predictor, sum(predictor.startup_timings.values()), 0.0)
+        self.last_error = None
+        self.swaps = 0
+        self._fingerprint = self._model_fingerprint(predictor.model_path)
+        self._pending_fingerprint = None  # checkpoint of a reload requested or in progress
+        self.master = None
+
+    def request_reload(self, model_path=None):
+        """reload(), or under a prefork master a reload of every worker; False when one is already loading"""
+        if self.master is not None:
+            with self._lock:
+                self._pending_fingerprint = self._model_fingerprint(model_path or self.detector.predictor.model_path)
+            return self.master.send('reload', model_path)
+        return self.reload(model_path)
+
+    def request_rollback(self):
+        """rollback(), or under a prefork master a rollback of every worker; False when there is nothing to roll back to"""
+        if self.master is not None:
+            with self._lock:
+                if self._previous is None:
+                    return False
+            return self.master.send('rollback')
+        return self.rollback()
+
+    def reload(self, model_path=None, wait=False):
+        """Load model_path (default: the active one) in the background and swap it in.
+
+        Returns False when a load is already in progress.
+        """
+        model_path = model_path or self.detector.predictor.model_path
+        with self._lock:
+            if self._loading is not None and self._loading.is_alive():
+                return False
+            self._pending_fingerprint = self._model_fingerprint(model_path)
+            self._loading = threading.Thread(target=self._load, args=(model_path,), name='model-reload', daemon=True)
+            self._loading.start()
+            thread = self._loading
+        if wait:
+            thread.join()
+        return True
+
+    def rollback(self):
+        """Swap the previous predictor back in; returns False when there is none"""
+        with self._lock:
+            if self._previous is None:
+                return False
+            previous, self._previous = self._previous, None
+        
+        # Outside the lock: with an inference pool the swap is a rolling worker restart
+        current = self.detector.swap_predictor(previous['predictor'])
+        with self._lock:
+            self._previous = {'predictor': current, 'info': self.active}
+            self.active = dict(previous['info'], activated_at=time.time())
+            self.swaps += 1
+        return True
+
+    def is_loading(self):
+        with self._lock:
+            return self._loading is not None and self._loading.is_alive()
+    
+    def warm_up(self):
+        """Warm up the active predictor, e.g. in a freshly forked worker before it takes requests"""
+        self._warm_up(self.detector.predictor)
+    
+    def status(self):
+        with self._lock:
+            return {
+                'active': self.active,
+                'previous': self._previous['info'] if self._previous else None,
+                'loading': self._loading is not None and self._loading.is_alive(),
+                'last_error': self.last_error,
+                'swaps': self.swaps,
+                'watch_interval': self.watch_interval
+            }
+
+    def ensure_watching(self):
+        """Start the file watcher in this process; called per request so forked workers get their own.
+
+        Under a prefork master only the master watches.
+        """
+        if self.watch_interval <= 0 or self._watcher_pid == os.getpid():
+            return
+        if self.master is not None and not self.master.in_master():
+            return
+        with self._lock:
+            if self._watcher_pid != os.getpid():
+                self._watcher_pid = os.getpid()
+                threading.Thread(target=self._watch, name='model-watcher', daemon=True).start()
+
+    def _load(self, model_path):
+        try:
+            self._load_and_swap(model_path)
+        finally:
+            with self._lock:
+                self._pending_fingerprint = None
+    
+    def _load_and_swap(self, model_path):
+        current = self.detector.predictor
+        start = time.perf_counter()
+        # Same kind of predictor and settings as the active one, only the checkpoint changes
+        predictor = type(current)(**dict(current.init_kwargs(), model_path=model_path))
+        load_ms = (time.perf_counter() - start) * 1000
+
+        if predictor.model is None:
+            # Keep serving the current model rather than swapping in nothing
+            predictor.release_snapshot()
+            with self._lock:
+                self.last_error = f"No loadable model in {model_path}"
+                self._fingerprint = self._model_fingerprint(model_path)
+            print(f"Model reload failed, keeping {current.model_version}: {self.last_error}")
+            return
+
+        start = time.perf_counter()
+        if self.master is None:
+            self._warm_up(predictor)
+        warmup_ms = (time.perf_counter() - start) * 1000
+
+        try:
+            previous = self.detector.swap_predictor(predictor)
+        except Exception as e:
+            predictor.release_snapshot()
+            with self._lock:
+                self.last_error = f"Swap failed: {e}"
+            print(f"Model swap failed, keeping {current.model_version}: {e}")
+            return
+        with self._lock:
+            dropped = self._previous
+            self._previous = {'predictor': previous, 'info': self.active}
+            self.active = self._describe(predictor, load_ms, warmup_ms)
+            self._fingerprint = self._model_fingerprint(model_path)
+            self.last_error = None
+            self.swaps += 1
+        if dropped is not None:
+            # Nothing can roll back to it any more, so its checkpoint copy can go
+            dropped['predictor'].release_snapshot()
+        print(f"Swapped in model {predictor.model_version} (load {load_ms:.0f} ms, warm-up {warmup_ms:.0f} ms)")
+
+    def _warm_up(self, predictor):
+        """Run the first inferences off the request path: allocator, kernels and buffers get primed"""
+        image = np.random.randint(0, 255, (224, 224, 3), dtype=np.uint8)
+        for tta_mode in {predictor.tta_mode, 'none'}:
+            for _ in range(self.warmup_runs):
+                predictor.predict_single(image, tta_mode)
+
+    def _watch(self):
+        while True:
+            time.sleep(self.watch_interval)
+            model_path = self.detector.predictor.model_path
+            fingerprint = self._model_fingerprint(model_path)
+            with self._lock:
+                # Already loaded, or already on its way: requesting it again would load it twice
+                known = fingerprint in (self._fingerprint, self._pending_fingerprint)
+                loading = self._loading is not None and self._loading.is_alive()
+            if known or loading:
+                continue
+            # Wait for a changed file to stop changing before loading it
+            if fingerprint == self._settled_fingerprint(model_path):
+                self.request_reload(model_path)
+
+    def _settled_fingerprint(self, model_path):
+        time.sleep(1.0)
+        return self._model_fingerprint(model_path)
+
+    @classmethod
+    def _model_fingerprint(cls, model_path):
+        fingerprint = []
+        for name in cls.WATCHED_FILES:
+            try:
+                stat = os.stat(os.path.join(model_path, name))
+                fingerprint.append((name, stat.st_size, stat.st_mtime))
+            except OSError:
+                pass
+        return tuple(fingerprint)
+
+    @staticmethod
+    def _describe(predictor, load_ms, warmup_ms):
+        return {
+            'version': predictor.model_version,
+            'model_name': predictor.model_name,
+            'model_path': predictor.model_path,
+            'inference_mode': predictor.inference_mode,
+            'compiled_backend': predictor.compiled_backend,
+            'loaded': predictor.model is not None,
+            'load_ms': round(load_ms, 1),
+            'warmup_ms': round(warmup_ms, 1),
+            'activated_at': time.time()
+        }
+
+class MasterChannel:
+    """Model change requests from prefork workers to the master process.
+
+    Created in the master before it forks. A worker writes the command to
+    a shared pipe and sends the master SIGHUP; the master's handler reads
+    every queued command with receive().
+    """
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self._read, self._write = os.pipe()
+        os.set_blocking(self._read, False)
+
+    def in_master(self):
+        return os.getpid() == self.pid
+
+    def send(self, action, model_path=None):
+        # Writes this short are atomic, so commands from concurrent workers never interleave
+        os.write(self._write, json.dumps({'action': action, 'model_path': model_path}).encode() + b'\n')
+        os.kill(self.pid, signal.SIGHUP)
+        return True
+
+    def receive(self):
+        """Commands queued since the last call, oldest first"""
+        data = b''
+        while True:
+            try:
+                chunk = os.read(self._read, 65536)
+            except BlockingIOError:
+                break
+            if not chunk:
+                break
+            data += chunk
+        return [json.loads(line) for line in data.splitlines() if line]
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+class PredictionCache:
+    """Content-addressed cache of analysis results.
+    
+    Keys hash the decoded pixels together with the model version and TTA
+    mode, so re-uploads of the same photo skip the model entirely. Results
+    live in an in-memory LRU and, optionally, in a size-bounded directory of
+    JSON files that survives restarts.
+    """
+    
+    def __init__(self, max_entries=1024, cache_dir=None, max_disk_mb=256):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = int(max_disk_mb * 1024 * 1024)
+        
+        self._memory = OrderedDict()
+        self._disk = OrderedDict()  # key -> file size, least recently used first
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._scan_disk()
+    
+    @staticmethod
+    def key_for(image_array, model_version, tta_mode):
+        """Hash of the decoded pixels plus everything that changes the prediction"""
+        image_array = np.ascontiguousarray(image_array)
+        digest = hashlib.sha256()
+        digest.update(f"{model_version}|{tta_mode}|{image_array.shape}|{image_array.dtype}|".encode())
+        digest.update(memoryview(image_array).cast('B'))
+        return digest.hexdigest()
+    
+    def get(self, key):
+        """Return a copy of the cached result, or None on a miss"""
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return dict(self._memory[key])
+        
+        result = self._read_disk(key)
+        with self._lock:
+            if result is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._remember(key, result)
+        return dict(result)
+    
+    def put(self, key, result):
+        """Store a result in memory and, when enabled, on disk"""
+        with self._lock:
+            self._remember(key, dict(result))
+        self._write_disk(key, result)
+    
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            for key in list(self._disk):
+                self._remove_disk(key)
+    
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0,
+                'memory_entries': len(self._memory),
+                'max_entries': self.max_entries,
+                'disk_entries': len(self._disk),
+                'disk_bytes': self._disk_bytes,
+                'max_disk_bytes': self.max_disk_bytes if self.cache_dir else 0
+            }
+    
+    def _remember(self, key, result):
+        self._memory[key] = result
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+    
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.json')
+    
+    def _scan_disk(self):
+        """Rebuild the disk index, oldest files first, and trim it to size"""
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith('.json'):
+                    stat = os.stat(os.path.join(root, name))
+                    entries.append((stat.st_mtime, name[:-5], stat.st_size))
+        
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+        self._evict_disk()
+    
+    def _read_disk(self, key):
+        if not self.cache_dir:
+            return None
+        with self._lock:
+            if key not in self._disk:
+                return None
+            self._disk.move_to_end(key)
+        
+        path = self._path(key)
+        try:
+            with open(path, 'r') as f:
+                result = json.load(f)
+            os.utime(path)
+            return result
+        except (OSError, ValueError):
+            with self._lock:
+                self._remove_disk(key)
+            return None
+    
+    def _write_disk(self, key, result):
+        if not self.cache_dir:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(result, f)
+            os.replace(tmp_path, path)
+            size = os.path.getsize(path)
+        except OSError as e:
+            print(f"Warning: Could not write prediction cache entry: {e}")
+            return
+        
+        with self._lock:
+            self._disk_bytes += size - self._disk.get(key, 0)
+            self._disk[key] = size
+            self._disk.move_to_end(key)
+            self._evict_disk()
+    
+    def _evict_disk(self):
+        while self._disk and self._disk_bytes > self.max_disk_bytes:
+            self._remove_disk(next(iter(self._disk)))
+    
+    def _remove_disk(self, key):
+        self._disk_bytes -= self._disk.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
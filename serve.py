@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Production launcher: preloads the detector and model weights once in a
+master process, then forks worker processes that share them copy-on-write
+and serve requests from one listening socket.
+
+Usage: python serve.py [--workers N] [--torch-threads N] [--port 5000]
+Linux/macOS only (requires os.fork).
+
+Model reloads and rollbacks (the /api/model endpoints, the checkpoint
+watcher, or `kill -HUP <master pid>`) are carried out by the master, which
+then forks a fresh set of workers and lets the old ones finish their
+requests once the new ones have warmed up, so every worker serves the same
+model from shared memory. Warm-up runs in the workers after the fork: no
+forward pass ever runs in the master.
+"""
+
+import argparse
+import gc
+import os
+import select
+import signal
+import socket
+import sys
+import threading
+import time
+
+import config
+
+
+def process_memory(pid):
+    """Resident memory of a process in MB: rss, pss (shared pages split between sharers), private and shared"""
+    fields = {}
+    try:
+        # smaps_rollup (Linux 4.14+) sums every mapping in one read
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == 'kB':
+                    fields[parts[0].rstrip(':')] = int(parts[1])
+    except OSError:
+        return None
+
+    private = fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)
+    shared = fields.get('Shared_Clean', 0) + fields.get('Shared_Dirty', 0)
+    return {
+        'rss_mb': round(fields.get('Rss', 0) / 1024, 1),
+        'pss_mb': round(fields.get('Pss', 0) / 1024, 1),
+        'private_mb': round(private / 1024, 1),
+        'shared_mb': round(shared / 1024, 1)
+    }
+
+
+def report_memory(master_pid, worker_pids):
+    print(f"{'process':<16}{'pid':>8}{'rss MB':>10}{'pss MB':>10}{'private MB':>12}{'shared MB':>11}")
+    total_pss = 0.0
+    for name, pid in [('master', master_pid)] + [(f'worker {i}', pid) for i, pid in enumerate(worker_pids)]:
+        memory = process_memory(pid)
+        if memory is None:
+            print(f"{name:<16}{pid:>8}{'n/a':>10}")
+            continue
+        total_pss += memory['pss_mb']
+        print(f"{name:<16}{pid:>8}{memory['rss_mb']:>10}{memory['pss_mb']:>10}"
+              f"{memory['private_mb']:>12}{memory['shared_mb']:>11}")
+    # PSS adds up to the real footprint; summing RSS would count the shared weights once per worker
+    print(f"{'total (pss)':<16}{'':>8}{'':>10}{round(total_pss, 1):>10}")
+    sys.stdout.flush()
+
+
+def set_torch_threads(threads):
+    import torch
+
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # already fixed once inter-op work has run
+
+
+def stop_worker(*_):
+    raise SystemExit(0)
+
+
+class RequestTracker:
+    """Counts requests in progress on a threaded server, so a stopping worker can let them finish"""
+
+    def __init__(self, server):
+        self.active = 0
+        self._lock = threading.Lock()
+        if not hasattr(server, 'process_request_thread'):
+            return  # single-threaded: serve_forever only returns between requests
+
+        process_request, process_request_thread = server.process_request, server.process_request_thread
+
+        def counted(request, client_address):
+            # Counted on the accepting thread, so nothing accepted is missed
+            with self._lock:
+                self.active += 1
+            process_request(request, client_address)
+
+        def handled(request, client_address):
+            try:
+                process_request_thread(request, client_address)
+            finally:
+                with self._lock:
+                    self.active -= 1
+
+        server.process_request, server.process_request_thread = counted, handled
+
+    def wait(self, timeout):
+        deadline = time.monotonic() + timeout
+        while self.active and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+
+def run_worker(app, upload_writer, model_manager, sock, args, threads, ready_fd=None):
+    """Worker process body: serve from the inherited socket until terminated, never returning.
+
+    The model is warmed up before the first request is accepted; closing
+    ready_fd then tells the master. SIGTERM stops accepting; requests
+    already running get up to --graceful-timeout seconds to finish.
+    """
+    from werkzeug.serving import make_server
+
+    signal.signal(signal.SIGTERM, stop_worker)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # The default action for SIGUSR1 and SIGHUP is to terminate; both are for the master
+    signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    set_torch_threads(threads)
+
+    status = 0
+    try:
+        model_manager.warm_up()
+        if ready_fd is not None:
+            os.close(ready_fd)
+        server = make_server(args.host, args.port, app, threaded=args.threaded, fd=sock.fileno())
+        requests = RequestTracker(server)
+        # shutdown() waits for serve_forever to return, so it cannot run on this thread
+        signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown, daemon=True).start())
+        server.serve_forever()
+        requests.wait(args.graceful_timeout)
+    except SystemExit:
+        pass
+    except BaseException as e:
+        print(f"Worker {os.getpid()} failed: {e}")
+        status = 1
+    finally:
+        # Leave via _exit so the master's code after fork() never runs here
+        upload_writer.flush()
+        sys.stdout.flush()
+        os._exit(status)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prefork server with a shared preloaded model')
+    parser.add_argument('--host', default=config.SERVER_HOST)
+    parser.add_argument('--port', type=int, default=config.SERVER_PORT)
+    parser.add_argument('--workers', type=int, default=config.SERVER_WORKERS, help='worker processes (0 = one per core)')
+    parser.add_argument('--torch-threads', type=int, default=config.TORCH_THREADS,
+                        help='torch intra-op threads per worker (0 = cores / workers)')
+    parser.add_argument('--no-threads', dest='threaded', action='store_false', default=config.SERVER_THREADED,
+                        help='handle one request at a time per worker')
+    parser.add_argument('--graceful-timeout', type=float, default=30.0,
+                        help='seconds a stopping worker waits for its running requests')
+    parser.add_argument('--warmup-timeout', type=float, default=120.0,
+                        help='seconds re-forked workers get to warm up before the old ones are stopped')
+    parser.add_argument('--memory-report-after', type=float, default=10.0,
+                        help='seconds after startup to print per-process memory (0 = never); SIGUSR1 prints it on demand')
+    args = parser.parse_args()
+
+    if not hasattr(os, 'fork'):
+        sys.exit('serve.py needs os.fork; use run.py on this platform')
+
+    cores = os.cpu_count() or 1
+    workers = args.workers or cores
+    threads = args.torch_threads or max(1, cores // workers)
+
+    # Bind before forking so every worker accepts from the same socket
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(128)
+    sock.set_inheritable(True)
+
+    # Importing app builds the detector and loads the weights once, here in the master.
+    # Background threads (micro-batching, upload writer) start lazily, so none exist yet.
+    started = time.perf_counter()
+    from app import app, detector, upload_writer, model_manager
+    from model_manager import MasterChannel
+    print(f"Preloaded model '{detector.predictor.model_version}' in {time.perf_counter() - started:.1f}s")
+    if config.INFERENCE_WORKERS and workers > 1:
+        # Each forked worker starts a pool of its own, none of them sharing the preloaded weights
+        print(f"WARNING: INFERENCE_WORKERS={config.INFERENCE_WORKERS} with {workers} server workers loads "
+              f"{workers * config.INFERENCE_WORKERS} model copies; use one server worker (--workers 1) "
+              f"or INFERENCE_WORKERS=0")
+
+    # Any worker may be asked for an upload right after another one received it,
+    # and bytes not yet written exist only in the receiving worker's memory
+    upload_writer.write_through = True
+
+    # Model changes requested in any worker are applied here and reach every worker by re-forking
+    model_manager.master = MasterChannel()
+
+    # Move everything allocated so far out of the collector's reach, so collections in the
+    # workers do not write to (and un-share) the pages holding the preloaded objects
+    gc.collect()
+    gc.freeze()
+
+    worker_pids = []
+
+    def spawn(ready_fd=None):
+        pid = os.fork()
+        if pid == 0:
+            run_worker(app, upload_writer, model_manager, sock, args, threads, ready_fd)
+        return pid
+
+    def refork():
+        """Replace every worker with one forked from the current state; the old ones drain and exit
+        once the new ones are warmed up, or after --warmup-timeout"""
+        gc.collect()
+        gc.freeze()
+        retiring = list(worker_pids)
+        ready_read, ready_write = os.pipe()
+        for index in range(len(worker_pids)):
+            worker_pids[index] = spawn(ready_write)
+        os.close(ready_write)
+        # Each new worker closes its copy of the write end when warmed up (or by exiting); EOF means all have
+        deadline = time.monotonic() + args.warmup_timeout
+        while time.monotonic() < deadline:
+            readable, _, _ = select.select([ready_read], [], [], max(0.0, deadline - time.monotonic()))
+            if not readable or not os.read(ready_read, 64):
+                break
+        os.close(ready_read)
+        for pid in retiring:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        print(f"Re-forked {len(worker_pids)} workers on model '{detector.predictor.model_version}'")
+        sys.stdout.flush()
+
+    changes = {'requested': False}
+
+    def change_model(*_):
+        # Only noted here; the main loop applies it, outside the signal handler
+        changes['requested'] = True
+
+    def apply_model_changes():
+        """Carry out the queued reloads and rollbacks, then re-fork once if the model changed"""
+        changes['requested'] = False
+        # A SIGHUP with nothing queued, such as `kill -HUP <master pid>`, reloads the active model
+        commands = model_manager.master.receive() or [{'action': 'reload', 'model_path': None}]
+        swaps = model_manager.swaps
+        reloaded = set()
+        for command in commands:
+            if command['action'] == 'rollback':
+                model_manager.rollback()
+            elif command.get('model_path') not in reloaded:
+                # Loaded here rather than on a thread, so no fork() can happen in the middle of it
+                reloaded.add(command.get('model_path'))
+                model_manager.reload(command.get('model_path'), wait=True)
+        if model_manager.swaps != swaps:
+            refork()
+
+    for _ in range(workers):
+        worker_pids.append(spawn())
+    print(f"Serving on http://{args.host}:{args.port} with {workers} workers x {threads} torch threads")
+    sys.stdout.flush()
+
+    def shutdown(*_):
+        for pid in worker_pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in worker_pids:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGUSR1, lambda *_: report_memory(os.getpid(), worker_pids))
+    signal.signal(signal.SIGHUP, change_model)
+    model_manager.ensure_watching()
+    if args.memory_report_after > 0:
+        signal.signal(signal.SIGALRM, lambda *_: report_memory(os.getpid(), worker_pids))
+        signal.setitimer(signal.ITIMER_REAL, args.memory_report_after)
+
+    # Apply model changes and replace workers that die; the copy-on-write model is still in the master
+    while True:
+        if changes['requested']:
+            apply_model_changes()
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid == 0:
+            time.sleep(0.2)
+            continue
+        if pid in worker_pids:
+            index = worker_pids.index(pid)
+            print(f"Worker {index} (pid {pid}) exited with status {status}, restarting")
+            worker_pids[index] = spawn()
+
+
+if __name__ == '__main__':
+    main()
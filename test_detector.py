@@ -0,0 +1,136 @@
+"""Tests for EnhancedFruitDiseaseDetector, with a stand-in predictor so no trained model is needed"""
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from advanced_predictor import EnhancedFruitDiseaseDetector
+from metrics import metrics
+from prediction_cache import PredictionCache
+
+
+class StubPredictor:
+    """Just enough of AdvancedPredictor for the detector: every image is a healthy apple"""
+    model = object()
+    model_version = 'stub'
+    inference_mode = 'fp32'
+    tta_mode = 'none'
+
+    def predict_single(self, image, tta_mode=None):
+        return {'fruit': 'Apple', 'disease': 'Healthy', 'confidence': 97.0, 'is_healthy': True,
+                'high_confidence': True, 'tta_passes': 1}
+
+    def predict_batch(self, images, batch_size=16, tta_mode=None):
+        for image in images:
+            yield self.predict_single(image, tta_mode)
+
+    def add_disease_info(self, prediction):
+        return prediction
+
+    def result_settings(self):
+        return 'exit=0.9/0.5'
+
+
+class CascadeStubPredictor(StubPredictor):
+    """Answers like CascadePredictor when the first stage is confident enough"""
+
+    def predict_single(self, image, tta_mode=None):
+        return dict(super().predict_single(image, tta_mode), cascade_stage='fast', first_stage_confidence=97.0)
+
+
+class FailingStubPredictor(StubPredictor):
+    """Raises out of the batch engine for images whose first pixel is 1"""
+
+    def predict_single(self, image, tta_mode=None):
+        if image[0, 0, 0] == 1:
+            raise RuntimeError('decoder crashed')
+        return super().predict_single(image, tta_mode)
+
+
+def counter(name):
+    for line in metrics.render().splitlines():
+        if line.split(' ')[0] in (f'fruit_{name}', f'fruit_{name}{{}}'):
+            return int(line.split(' ')[1])
+    return 0
+
+
+def test_analyze_batch_counts_cache_hits_and_misses():
+    detector = EnhancedFruitDiseaseDetector(predictor=StubPredictor(), cache=PredictionCache(max_entries=16))
+    seen = np.zeros((8, 8, 3), dtype=np.uint8)
+    detector.analyze_image(seen)
+
+    hits, misses = counter('cache_hits_total'), counter('cache_misses_total')
+    new = [np.full((8, 8, 3), value, dtype=np.uint8) for value in (1, 2)]
+    results = list(detector.analyze_batch([seen] + new))
+
+    assert [result.get('cached', False) for result in results] == [True, False, False]
+    assert counter('cache_hits_total') - hits == 1
+    assert counter('cache_misses_total') - misses == 2
+
+
+def test_analyze_batch_yields_one_analysis_per_image_when_one_fails():
+    detector = EnhancedFruitDiseaseDetector(predictor=FailingStubPredictor())
+    images = [np.full((8, 8, 3), value, dtype=np.uint8) for value in (0, 1, 2, 3)]
+    results = list(detector.analyze_batch(images))
+
+    assert [result['prediction'] for result in results] == ['Apple_healthy', 'unknown_error', 'Apple_healthy',
+                                                            'Apple_healthy']
+    assert results[1]['error'] == 'decoder crashed'
+
+
+def test_format_analysis_keeps_cascade_stage():
+    detector = EnhancedFruitDiseaseDetector(predictor=CascadeStubPredictor())
+    analysis = detector.analyze_image(np.zeros((8, 8, 3), dtype=np.uint8))
+
+    assert analysis['cascade_stage'] == 'fast'
+    assert analysis['first_stage_confidence'] == '97.0%'
+
+
+@pytest.fixture(scope='module')
+def app_module(tmp_path_factory):
+    """The Flask app, with every file it keeps (database, journals, uploads, caches) in a temporary directory"""
+    data_dir = tmp_path_factory.mktemp('app-data')
+    with pytest.MonkeyPatch.context() as patch:
+        for name, path in [('DATABASE_FILE', 'analysis_data.json'), ('FEEDBACK_JOURNAL', 'feedback_data.jsonl'),
+                           ('CORRECTIONS_JOURNAL', 'corrections.jsonl'), ('UPLOAD_DIR', 'uploads'),
+                           ('DERIVATIVE_CACHE_DIR', 'derivatives'), ('MODEL_PATH', 'models')]:
+            patch.setenv(name, str(data_dir / path))
+        # config reads the environment on import, so app must be imported after it is set
+        import app
+        yield app
+
+
+def test_predict_json_reports_cascade_stage(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'detector', EnhancedFruitDiseaseDetector(predictor=CascadeStubPredictor()))
+
+    upload = io.BytesIO()
+    Image.new('RGB', (32, 32), (120, 180, 60)).save(upload, format='JPEG')
+    upload.seek(0)
+    response = app_module.app.test_client().post('/predict', data={'file': (upload, 'apple.jpg')},
+                                                 headers={'Accept': 'application/json'})
+
+    body = response.get_json()
+    assert body['success'] is True
+    assert body['cascade_stage'] == 'fast'
+    assert body['first_stage_confidence'] == '97.0%'
+
+
+def test_results_are_not_cached_during_a_predictor_swap():
+    detector = EnhancedFruitDiseaseDetector(predictor=StubPredictor(), cache=PredictionCache(max_entries=16))
+    image = np.zeros((8, 8, 3), dtype=np.uint8)
+
+    class RollingScheduler:
+        """Serves a request while its workers restart, as InferencePool does"""
+
+        def swap_predictor(self, predictor):
+            detector.analyze_image(image)
+
+        def predict(self, image, tta_mode=None):
+            return detector.predictor.predict_single(image, tta_mode)
+
+    detector.scheduler = RollingScheduler()
+    detector.swap_predictor(StubPredictor())
+
+    assert 'cached' not in detector.analyze_image(image)
+    assert detector.analyze_image(image)['cached'] is True
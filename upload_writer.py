@@ -0,0 +1,144 @@
+import atexit
+import os
+import queue
+import threading
+import time
+
+class UploadWriter:
+    """Persists uploaded originals on a background thread.
+    
+    Requests hand over the raw upload bytes and continue straight to
+    inference. Until a file is on disk its bytes stay available through
+    pending(), so the upload URL can be served immediately.
+    
+    Those bytes live only in the process that received the upload. With
+    several server processes (serve.py) write_through=True writes on the
+    request thread instead, so any process can read the file as soon as
+    the request has returned.
+    
+    A write can fail (disk full, permissions); confirm() tells the request
+    whether its upload made it to disk before anything refers to it.
+    """
+    
+    def __init__(self, upload_dir='web/static/uploads', max_pending=256, write_through=False):
+        self.upload_dir = upload_dir
+        self.max_pending = max_pending
+        self.write_through = write_through
+        
+        self._queue = queue.Queue()
+        self._pending = {}
+        self._failed = {}  # filename -> bytes of a write that failed, until confirm() retries it
+        self._lock = threading.Lock()
+        self._settled = threading.Condition(self._lock)
+        self._thread = None
+        
+        self.written = 0
+        self.failed = 0
+        self.inline_writes = 0
+        self.flush_seconds_total = 0.0
+        self.flush_seconds_max = 0.0
+        
+        os.makedirs(self.upload_dir, exist_ok=True)
+        atexit.register(self.flush)
+    
+    def submit(self, filename, data):
+        """Queue raw bytes to be written as upload_dir/filename"""
+        if self.write_through:
+            self._write(filename, data, time.perf_counter())
+            return
+        
+        with self._lock:
+            backlog = len(self._pending) >= self.max_pending
+            if backlog:
+                self.inline_writes += 1
+            else:
+                self._pending[filename] = data
+        
+        if backlog:
+            # Too far behind: write on the request thread rather than grow without bound
+            self._write(filename, data, time.perf_counter())
+            return
+        
+        self._ensure_started()
+        self._queue.put((filename, data, time.perf_counter()))
+    
+    def pending(self, filename):
+        """Bytes of an upload that has not reached disk yet, or None"""
+        with self._lock:
+            return self._pending.get(filename)
+    
+    def confirm(self, filename, timeout=5.0):
+        """Wait for an upload's write and return whether the file is on disk.
+        
+        A failed write is retried once on the calling thread. Still queued
+        after timeout counts as saved: pending() keeps serving it meanwhile.
+        """
+        with self._settled:
+            self._settled.wait_for(lambda: filename not in self._pending, timeout)
+            data = self._failed.pop(filename, None)
+            if data is not None:
+                self.inline_writes += 1
+        if data is None:
+            return True
+        return self._write(filename, data, time.perf_counter(), keep_failed=False)
+    
+    def flush(self):
+        """Block until every queued upload is on disk"""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.join()
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'write_through': self.write_through,
+                'queue_depth': len(self._pending),
+                'written': self.written,
+                'failed': self.failed,
+                'awaiting_retry': len(self._failed),
+                'inline_writes': self.inline_writes,
+                'average_flush_ms': round(self.flush_seconds_total / self.written * 1000, 2) if self.written else 0,
+                'max_flush_ms': round(self.flush_seconds_max * 1000, 2)
+            }
+    
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='upload-writer', daemon=True)
+                self._thread.start()
+    
+    def _run(self):
+        while True:
+            filename, data, queued_at = self._queue.get()
+            try:
+                self._write(filename, data, queued_at)
+            finally:
+                self._queue.task_done()
+    
+    def _write(self, filename, data, queued_at, keep_failed=True):
+        path = os.path.join(self.upload_dir, filename)
+        try:
+            # Write to a temporary name so readers never see a partial file
+            tmp_path = path + '.part'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            
+            elapsed = time.perf_counter() - queued_at
+            with self._lock:
+                self.written += 1
+                self.flush_seconds_total += elapsed
+                self.flush_seconds_max = max(self.flush_seconds_max, elapsed)
+            return True
+        except OSError as e:
+            print(f"Warning: Could not save upload {filename}: {e}")
+            with self._lock:
+                self.failed += 1
+                if keep_failed and len(self._failed) < self.max_pending:
+                    self._failed[filename] = data
+            return False
+        finally:
+            with self._settled:
+                self._pending.pop(filename, None)
+                self._settled.notify_all()